@@ -0,0 +1,231 @@
+import gc
+import os
+import sys
+import threading
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+# --- MEMORY LIMITS ---
+# Process RSS (MB) above which cached datasets and artifacts are evicted; 0 disables
+MEMORY_HIGH_WATER_MB = int(os.getenv("MEMORY_HIGH_WATER_MB", "0"))
+# RSS (MB) an eviction round brings the process down to (default: 90% of the high-water mark)
+MEMORY_LOW_WATER_MB = int(os.getenv("MEMORY_LOW_WATER_MB", "0"))
+# After a round that couldn't get below the high-water mark, RSS must grow
+# by this much (MB) before eviction is tried again
+MEMORY_RETRY_GROWTH_MB = int(os.getenv("MEMORY_RETRY_GROWTH_MB", "64"))
+# Projected RSS (MB) above which new uploads are refused; 0 disables
+MEMORY_REFUSE_MB = int(os.getenv("MEMORY_REFUSE_MB", "0"))
+# Parsed frame size relative to the CSV file (numeric columns land near 1x, strings higher)
+UPLOAD_EXPANSION = float(os.getenv("UPLOAD_EXPANSION", "2.0"))
+# Trace Python allocations per endpoint (tracemalloc slows allocation-heavy code down)
+MEMORY_TRACE = os.getenv("MEMORY_TRACE", "0") == "1"
+
+MB = 1024 * 1024
+
+
+def deep_size(obj, _seen=None) -> int:
+    """
+    Approximate bytes held by `obj` and everything it references: pandas
+    objects via memory_usage(deep=True), numpy arrays by nbytes, containers
+    recursively. Shared references are counted once.
+    """
+    seen = _seen if _seen is not None else set()
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+
+    if isinstance(obj, pd.DataFrame):
+        return int(obj.memory_usage(deep=True, index=True).sum())
+    if isinstance(obj, (pd.Series, pd.Index)):
+        return int(obj.memory_usage(deep=True))
+    if isinstance(obj, np.ndarray):
+        return int(obj.nbytes)
+
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(deep_size(k, seen) + deep_size(v, seen) for k, v in obj.items())
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        size += sum(deep_size(item, seen) for item in obj)
+    return size
+
+
+def process_rss() -> int:
+    """
+    Resident set size of this process in bytes (peak RSS where /proc is missing).
+    """
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # KB on Linux, bytes on macOS
+        return peak if sys.platform == "darwin" else peak * 1024
+
+
+def to_mb(nbytes) -> float:
+    return round(nbytes / MB, 2)
+
+
+def release_freed_memory(collect=True):
+    """
+    Collects garbage (unless `collect` is False) and hands freed heap pages
+    back to the OS. glibc keeps them otherwise, so RSS wouldn't drop after
+    an eviction.
+    """
+    if collect:
+        gc.collect()
+    try:
+        import ctypes
+        ctypes.CDLL("libc.so.6").malloc_trim(0)
+    except (OSError, AttributeError):
+        pass
+
+
+class MemoryGuard:
+    """
+    Keeps the process under configurable RSS marks.
+    Above `high_water_mb`, registered evictors run in order (cheapest loss
+    first) until RSS drops to `low_water_mb` or nothing is left to evict.
+    A round that can't get below the high-water mark isn't repeated until
+    RSS grows by `retry_growth_mb`. Evictors registered with `current=True`
+    (what the active dataset needs) only run once RSS exceeds `refuse_mb`.
+    Uploads whose projected size would push RSS past `refuse_mb` are refused,
+    after evicting what can be evicted.
+    """
+
+    def __init__(self, high_water_mb=MEMORY_HIGH_WATER_MB, refuse_mb=MEMORY_REFUSE_MB,
+                 low_water_mb=MEMORY_LOW_WATER_MB, retry_growth_mb=MEMORY_RETRY_GROWTH_MB):
+        self.high_water = high_water_mb * MB
+        self.low_water = low_water_mb * MB if low_water_mb else int(self.high_water * 0.9)
+        self.refuse = refuse_mb * MB
+        self.retry_growth = retry_growth_mb * MB
+        self._evictors = []  # (name, fn, current); fn() evicts one item and returns its label, or None
+        self._lock = threading.Lock()
+        self._stuck_at = None  # RSS after the last round that stayed above the high-water mark
+        self.evictions = []  # recent (name, label), newest last
+        self.refused = 0
+
+    def register(self, name: str, fn, current: bool = False):
+        self._evictors.append((name, fn, current))
+
+    def _evict_until(self, limit: int, include_current: bool):
+        evicted = []
+        for name, fn, current in self._evictors:
+            if current and not include_current:
+                continue
+            while process_rss() > limit:
+                label = fn()
+                if label is None:
+                    break
+                evicted.append((name, label))
+                release_freed_memory(collect=False)
+            if process_rss() <= limit:
+                break
+        if evicted:
+            release_freed_memory()
+            print(f"Evicting down to {to_mb(limit)} MB: evicted {', '.join(f'{n}:{l}' for n, l in evicted)} "
+                  f"(RSS now {to_mb(process_rss())} MB)")
+            self.evictions = (self.evictions + evicted)[-20:]
+        return evicted
+
+    def check(self):
+        """
+        Evicts down to the low-water mark once the high-water mark is
+        exceeded. Returns what was evicted.
+        """
+        if not self.high_water:
+            return []
+        rss = process_rss()
+        if rss <= self.high_water:
+            self._stuck_at = None
+            return []
+        if self._stuck_at is not None and rss < self._stuck_at + self.retry_growth:
+            # Nothing evictable helped last time; don't thrash on every request
+            return []
+        with self._lock:
+            evicted = self._evict_until(self.low_water, bool(self.refuse) and rss > self.refuse)
+            rss = process_rss()
+            self._stuck_at = rss if rss > self.high_water else None
+            return evicted
+
+    def admit(self, nbytes: int):
+        """
+        Whether an allocation of ~`nbytes` (e.g. parsing an upload) fits
+        under the refusal mark. Returns (success, message).
+        """
+        if not self.refuse:
+            return True, "ok"
+        with self._lock:
+            if process_rss() + nbytes > self.refuse:
+                self._evict_until(max(0, self.refuse - nbytes), include_current=True)
+            projected = process_rss() + nbytes
+            if projected > self.refuse:
+                self.refused += 1
+                return False, (f"Not enough memory: ~{to_mb(nbytes)} MB needed, "
+                               f"{to_mb(max(0, self.refuse - process_rss()))} MB available")
+        return True, "ok"
+
+    def stats(self):
+        return {
+            "rss_mb": to_mb(process_rss()),
+            "high_water_mb": to_mb(self.high_water) or None,
+            "low_water_mb": to_mb(self.low_water) or None,
+            "refuse_mb": to_mb(self.refuse) or None,
+            "recent_evictions": [f"{name}:{label}" for name, label in self.evictions],
+            "refused_uploads": self.refused,
+        }
+
+
+class MemoryTracer:
+    """
+    Optional per-endpoint allocation tracking with tracemalloc: net bytes
+    still allocated after each request and the traced peak during it.
+    Concurrent requests share one tracer, so figures under load are
+    approximate (the peak is process-wide).
+    """
+
+    def __init__(self, enabled=MEMORY_TRACE):
+        self.enabled = enabled
+        self._routes = {}
+        self._lock = threading.Lock()
+        if enabled:
+            tracemalloc.start()
+
+    def begin(self):
+        """
+        Marks the start of a request; pass the result to end().
+        """
+        if not self.enabled:
+            return None
+        tracemalloc.reset_peak()
+        return tracemalloc.get_traced_memory()[0]
+
+    def end(self, route: str, before):
+        if before is None:
+            return
+        after, peak = tracemalloc.get_traced_memory()
+        with self._lock:
+            item = self._routes.setdefault(route, {"calls": 0, "max_peak_mb": 0.0, "net_mb": 0.0})
+            item["calls"] += 1
+            item["max_peak_mb"] = max(item["max_peak_mb"], to_mb(peak - before))
+            item["net_mb"] = round(item["net_mb"] + to_mb(after - before), 2)
+
+    def stats(self, top: int = 0):
+        if not self.enabled:
+            return None
+        current, peak = tracemalloc.get_traced_memory()
+        with self._lock:
+            routes = {route: dict(item) for route, item in self._routes.items()}
+        result = {"traced_mb": to_mb(current), "peak_mb": to_mb(peak), "routes": routes}
+        if top:
+            stats = tracemalloc.take_snapshot().statistics("lineno")[:top]
+            result["top_allocations"] = [{"where": str(s.traceback), "mb": to_mb(s.size), "count": s.count} for s in stats]
+        return result
+
+
+# Singleton instances
+memory_guard = MemoryGuard()
+memory_tracer = MemoryTracer()
@@ -3,25 +3,54 @@ import pandas as pd
 import json
 import time
 import os
+import threading
+from contextlib import contextmanager
 from dotenv import load_dotenv
 
 from executor import execute_pandas_code
-from knowledge import kb
-from tools import search_web
-from analyzer import analyze_correlations
+from analyzer import get_correlation_stats
+from context import ContextBuilder, relevant_columns, column_lines, correlation_lines, top_shifts, estimate_tokens
 from normalizer import normalize_output
+from conversation import ConversationMemory
+from metrics import timer, timed
+from state import state
+from scheduler import llm_scheduler
 
 load_dotenv()
 
 # --- EXECUTION CONTROL ---
 RUN_LLM_ANALYSIS = True
 
+# --- MODEL RESIDENCY ---
+# How long Ollama keeps the model loaded after each request
+# (Go duration string: "30m", "2h"; "-1s" keeps it loaded indefinitely)
+OLLAMA_KEEP_ALIVE = os.getenv("OLLAMA_KEEP_ALIVE", "30m")
+MODEL_LOAD_TIMEOUT = float(os.getenv("MODEL_LOAD_TIMEOUT", "300"))
+
+# Tokens of conversation history added when explaining a result
+HISTORY_TOKEN_BUDGET = int(os.getenv("HISTORY_TOKEN_BUDGET", "200"))
+
+
+def normalize_keep_alive(value: str) -> str:
+    """
+    Gives unitless numbers ("-1", "3600") a seconds unit. The CLI's
+    --keepalive flag goes through Go's ParseDuration, which rejects them.
+    """
+    value = str(value).strip()
+    try:
+        float(value)
+    except ValueError:
+        return value
+    return f"{value}s"
+
 
 class DataAnalystAgent:
     def __init__(self):
-        self.memory = []
+        self.session_id = "default"  # scheduler fairness key for LLM calls
+        self.memory = ConversationMemory()
         self.df = None
         self.context_data = {}
+        self.last_prompt_tokens = None
 
         # Configuration
         self.backend = "ollama"
@@ -30,6 +59,12 @@ class DataAnalystAgent:
         # Ollama Config
         self.ollama_url = "http://localhost:11434/api/generate"
         self.ollama_model = "qwen2.5-coder:1.5b"
+        self.keep_alive = normalize_keep_alive(OLLAMA_KEEP_ALIVE)
+
+        # Load state of the selected model, updated by warm_up()
+        self.model_state = {"model": self.ollama_model, "status": "cold", "load_seconds": None,
+                            "loaded_at": None, "error": None}
+        self._model_lock = threading.Lock()
 
         # ---------------- SYSTEM PROMPTS ---------------- #
 
@@ -119,13 +154,70 @@ GLOBAL RULES
         return {
             "backend": self.backend,
             "model": self.ollama_model,
-            "connected": {"ollama": True}
+            "connected": {"ollama": True},
+            "keep_alive": self.keep_alive,
+            "model_state": self.get_model_state()
         }
 
     def set_model(self, model: str):
         self.ollama_model = model
+        self.warm_up_async()
         return f"Model switched to {model}"
 
+    # ---------------- MODEL RESIDENCY ---------------- #
+
+    def warm_up(self, model: str = None):
+        """
+        Loads the model into Ollama memory ahead of the first request.
+        A generate call without a prompt only loads the model; keep_alive
+        holds it resident afterwards.
+        """
+        model = model or self.ollama_model
+        with self._model_lock:
+            self.model_state = {"model": model, "status": "loading", "load_seconds": None,
+                                "loaded_at": None, "error": None}
+
+        start = time.time()
+        try:
+            res = requests.post(self.ollama_url, json={"model": model, "keep_alive": self.keep_alive},
+                                timeout=MODEL_LOAD_TIMEOUT)
+            res.raise_for_status()
+            state = {"status": "ready", "load_seconds": round(time.time() - start, 2), "loaded_at": time.time()}
+            print(f"Model {model} loaded in {state['load_seconds']}s (keep_alive={self.keep_alive}).")
+        except Exception as e:
+            state = {"status": "failed", "error": str(e)}
+            print(f"Model warm-up for {model} failed: {e}")
+
+        with self._model_lock:
+            # A newer switch owns the state now
+            if self.model_state["model"] == model:
+                self.model_state.update(state)
+        return state["status"] == "ready"
+
+    def warm_up_async(self, model: str = None):
+        threading.Thread(target=self.warm_up, args=(model,), daemon=True).start()
+
+    def get_model_state(self):
+        """
+        Last warm-up result, with residency checked against Ollama's list of
+        loaded models (/api/ps) since keep_alive may have expired since.
+        """
+        with self._model_lock:
+            state = dict(self.model_state)
+        if state["status"] != "ready":
+            return state
+        try:
+            ps_url = self.ollama_url.replace("/api/generate", "/api/ps")
+            loaded = requests.get(ps_url, timeout=2).json().get("models", [])
+            match = next((m for m in loaded if m.get("name") == state["model"] or m.get("model") == state["model"]), None)
+            state["resident"] = match is not None
+            state["expires_at"] = match.get("expires_at") if match else None
+            if match is None:
+                state["status"] = "cold"
+        except Exception:
+            state["resident"] = None
+        return state
+
     # ---------------- LLM CALL ---------------- #
 
     def _call_ollama(self, prompt: str, system_prompt: str):
@@ -134,7 +226,7 @@ GLOBAL RULES
         full_prompt = f"{system_prompt}\n\nUser Request:\n{prompt}"
 
         process = subprocess.Popen(
-            ["ollama", "run", self.ollama_model],
+            ["ollama", "run", "--keepalive", self.keep_alive, self.ollama_model],
             stdin=subprocess.PIPE,
             stdout=subprocess.PIPE,
             stderr=subprocess.PIPE,
@@ -150,13 +242,17 @@ GLOBAL RULES
 
         return stdout.strip()
 
-    def generate_direct(self, prompt: str, system_type: str = "analysis"):
-        return self._call_llm(prompt, system_type=system_type)
+    def generate_direct(self, prompt: str, system_type: str = "analysis", reject: bool = True):
+        return self._call_llm(prompt, system_type=system_type, reject=reject)
 
 
 
 
-    def _call_llm(self, prompt: str, system_type="analysis"):
+    def _call_llm(self, prompt: str, system_type="analysis", reject: bool = True):
+        """
+        One generation. Holds an LLM scheduler slot for the model call only;
+        with `reject`, raises SchedulerBusy instead of queueing when saturated.
+        """
         if not RUN_LLM_ANALYSIS:
             return "LLM disabled."
 
@@ -167,7 +263,10 @@ GLOBAL RULES
         else:
             system_prompt = self.system_prompt_analysis
 
-        return self._call_ollama(prompt, system_prompt)
+        self.last_prompt_tokens = estimate_tokens(system_prompt) + estimate_tokens(prompt)
+        print(f"LLM prompt ({system_type}): ~{self.last_prompt_tokens} tokens")
+        with timer("llm", system_type):
+            return llm_scheduler.run(self.session_id, self._call_ollama, prompt, system_prompt, reject=reject)
 
     # ---------------- DATA ---------------- #
 
@@ -177,25 +276,34 @@ GLOBAL RULES
 
     # ---------------- PERCEPTION ---------------- #
 
+    @timed("agent")
     def perceive(self, question: str):
         if self.df is None:
             raise ValueError("Dataset not loaded")
 
-        correlation_context = ""
+        correlation_stats = {}
         if any(k in question.lower() for k in ["cause", "correlation", "impact"]):
-            correlation_context = analyze_correlations(self.df)
-
-        return f"""
-COLUMNS: {list(self.df.columns)}
-SAMPLE:
-{self.df.head(1).to_string()}
-
-CORRELATIONS:
-{correlation_context}
-"""
+            correlation_stats = get_correlation_stats(self.df)
+        correlated = [item["feature"] for item in correlation_stats.get("top_correlations", [])[:5] + top_shifts(correlation_stats)[:5]]
+
+        # Most relevant columns in detail, the rest by name, all within the token budget
+        columns = relevant_columns(self.df, question, prefer=correlated)
+        others = [str(c) for c in self.df.columns if c not in columns]
+        builder = ContextBuilder()
+        builder.add(f"COLUMNS ({len(columns)} of {len(self.df.columns)}):", column_lines(self.df, columns), priority=0)
+        builder.add("CORRELATIONS:", correlation_lines(correlation_stats), priority=1)
+        if others:
+            builder.add("OTHER COLUMNS:", [", ".join(others[i:i + 10]) for i in range(0, len(others), 10)], priority=2)
+        builder.add("PREVIOUS CONVERSATION (newest first):", self.memory.context_lines(), priority=3)
+
+        context = builder.build()
+        print(f"Prompt context: ~{builder.stats['tokens']} tokens (budget {builder.stats['budget']}, "
+              f"{builder.stats['dropped_lines']} lines dropped)")
+        return context
 
     # ---------------- DECISION ---------------- #
 
+    @timed("agent")
     def decide(self, context: str, question: str):
         skip_words = ["explain", "summary", "recommend"]
         if any(w in question.lower() for w in skip_words):
@@ -209,6 +317,7 @@ CORRELATIONS:
 
     # ---------------- ACTION ---------------- #
 
+    @timed("agent")
     def act(self, code: str):
         if "NO_DATA_ANALYSIS_REQUIRED" in code:
             return True, "NO_DATA"
@@ -217,7 +326,8 @@ CORRELATIONS:
 
     # ---------------- EXPLAIN (ROUTER) ---------------- #
 
-    def explain(self, question: str, result):
+    @timed("agent")
+    def explain(self, question: str, result, reject: bool = True):
         prompt = f"""
     User Question:
     {question}
@@ -225,6 +335,12 @@ CORRELATIONS:
     Computed Result:
     {result}
     """
+        # Short follow-up context so "why is that?" has something to refer to
+        history = ContextBuilder(budget=HISTORY_TOKEN_BUDGET).add(
+            "Earlier in this conversation (newest first):", self.memory.context_lines(recent=1)
+        ).build()
+        if history:
+            prompt += f"\n{history}\n"
 
         failure_keywords = [
             "root cause",
@@ -236,10 +352,10 @@ CORRELATIONS:
         ]
 
         if any(k in question.lower() for k in failure_keywords):
-            return self._call_llm(prompt, system_type="failure")
+            return self._call_llm(prompt, system_type="failure", reject=reject)
 
         # Non-failure analysis
-        return self._call_llm(prompt, system_type="analysis")
+        return self._call_llm(prompt, system_type="analysis", reject=reject)
 
 
     # ---------------- RUN ---------------- #
@@ -252,10 +368,118 @@ CORRELATIONS:
         if not success:
             return f"Execution Error: {result}"
 
-        response = self.explain(question, result)
-        self.memory.append({"q": question, "a": response})
+        # Once decide() got through, don't throw its work away with a 429
+        response = self.explain(question, result, reject="NO_DATA_ANALYSIS_REQUIRED" in code)
+        self.memory.append(question, response)
         return response
 
 
+class SessionAgent(DataAnalystAgent):
+    """
+    Per-session agent: owns its dataset reference, context and memory,
+    but reads model, temperature and prompts live from the shared parent,
+    so settings changes apply to every session.
+    """
+
+    def __init__(self, parent: DataAnalystAgent, session_id: str = "default"):
+        self.parent = parent
+        self.session_id = session_id
+        self.memory = ConversationMemory()
+        self.df = None
+        self.context_data = {}
+        self.last_used = time.time()
+        self.active = 0  # requests or jobs currently using the session (see SessionRegistry.use)
+
+    def __getattr__(self, name):
+        # Only reached for attributes the session doesn't own (configuration)
+        if name == "parent":
+            raise AttributeError(name)
+        return getattr(self.parent, name)
+
+
+class SessionRegistry:
+    """
+    Maps session IDs to SessionAgents.
+    Bounded: idle sessions expire and the least recently used are evicted.
+    Conversation memory lives in the state backend, so a session's
+    follow-ups keep their history whichever worker process serves them.
+    """
+
+    def __init__(self, parent: DataAnalystAgent, max_sessions=64, idle_ttl=3600):
+        self.parent = parent
+        self.max_sessions = max_sessions
+        self.idle_ttl = idle_ttl
+        self._sessions = {}
+        self._lock = threading.Lock()
+
+    def get(self, session_id: str) -> SessionAgent:
+        now = time.time()
+        with self._lock:
+            for sid in [s for s, a in self._sessions.items() if not a.active and now - a.last_used > self.idle_ttl]:
+                del self._sessions[sid]
+
+            session = self._sessions.get(session_id)
+            if session is None:
+                idle = [s for s, a in self._sessions.items() if not a.active]
+                if len(self._sessions) >= self.max_sessions and idle:
+                    oldest = min(idle, key=lambda s: self._sessions[s].last_used)
+                    del self._sessions[oldest]
+                session = SessionAgent(self.parent, session_id)
+                session.memory.on_change = self._saver(session_id)
+                self._sessions[session_id] = session
+            session.last_used = now
+
+        # Another worker may have served this session since
+        snapshot = state.get(f"session_memory:{session_id}")
+        if snapshot is not None:
+            session.memory.restore(snapshot)
+        return session
+
+    def _saver(self, session_id):
+        def save(memory):
+            state.set(f"session_memory:{session_id}", memory.snapshot(), ttl=self.idle_ttl)
+        return save
+
+    @contextmanager
+    def use(self, session_id: str):
+        """
+        get() for the length of a request or job: the session counts as
+        active, so it is neither expired nor has its dataset dropped meanwhile.
+        """
+        session = self.get(session_id)
+        with self._lock:
+            session.active += 1
+        try:
+            yield session
+        finally:
+            with self._lock:
+                session.active -= 1
+                session.last_used = time.time()
+
+    def __len__(self):
+        return len(self._sessions)
+
+    def drop_frames(self, keep=None):
+        """
+        Clears dataset references other than `keep` from idle sessions, so
+        evicted datasets can actually be freed. Sessions get the current
+        dataset again on their next request.
+        """
+        with self._lock:
+            for session in self._sessions.values():
+                if not session.active and session.df is not keep:
+                    session.df = None
+
+    def memory_stats(self):
+        with self._lock:
+            memories = [s.memory.stats() for s in self._sessions.values()]
+        return {
+            "sessions": len(memories),
+            "conversation_bytes": sum(m["bytes"] for m in memories),
+            "summary_chars": sum(m["summary_chars"] for m in memories),
+        }
+
+
 # ---------- INSTANCE ----------
 agent_instance = DataAnalystAgent()
+sessions = SessionRegistry(agent_instance)
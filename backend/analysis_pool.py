@@ -0,0 +1,149 @@
+import os
+import importlib
+import threading
+from concurrent.futures import ProcessPoolExecutor, TimeoutError
+from concurrent.futures.process import BrokenProcessPool
+
+import pandas as pd
+
+from executor import shared_frames, _attach_frame
+from workers import process_context, without_main_path
+from metrics import timer
+
+# --- ANALYSIS OFFLOAD ---
+# Worker processes for CPU-heavy analyzer calls; 0 runs everything inline
+ANALYSIS_WORKERS = int(os.getenv("ANALYSIS_WORKERS", str(min(4, os.cpu_count() or 1))))
+# Smaller frames are cheaper to analyze inline than to hand to a worker
+ANALYSIS_OFFLOAD_MIN_CELLS = int(os.getenv("ANALYSIS_OFFLOAD_MIN_CELLS", "200000"))
+# Seconds an offloaded call may take; a worker past it is killed and the call fails
+ANALYSIS_TIMEOUT = float(os.getenv("ANALYSIS_TIMEOUT", "300"))
+
+# Functions that may run in a worker: name -> module
+OFFLOADED = {
+    "auto_eda": "analyzer",
+    "generate_plots": "analyzer",
+    "get_correlation_stats": "analyzer",
+    "get_failures": "reporting",
+}
+
+# Per worker process: the attached dataset, reused across tasks
+_current = None  # [frame name, shm, df]
+
+
+def _frame(name):
+    global _current
+    if _current is None or _current[0] != name:
+        if _current is not None:
+            _current[2] = None
+            try:
+                _current[1].close()
+            except BufferError:
+                pass
+        shm, df = _attach_frame(name)
+        _current = [name, shm, df]
+    return _current[2]
+
+
+def _run_analysis(frame_name, fn_name):
+    """
+    Worker side: runs analyzer function `fn_name` on the shared dataset.
+    """
+    fn = getattr(importlib.import_module(OFFLOADED[fn_name]), fn_name)
+    # Shallow copy so nothing the function adds sticks to the shared frame
+    return fn(_frame(frame_name).copy(deep=False))
+
+
+class AnalysisPool:
+    """
+    Process pool for CPU-bound analyzer work, so pandas/matplotlib calls on
+    large frames don't hold the API process's GIL. The dataset is shared
+    with the workers through the same SharedFrame segment the sandbox uses;
+    a task only ships the function name. Falls back to running inline if
+    the pool is disabled, the frame is small, or a worker dies.
+    """
+
+    def __init__(self, size=ANALYSIS_WORKERS, min_cells=ANALYSIS_OFFLOAD_MIN_CELLS, timeout=ANALYSIS_TIMEOUT):
+        self.size = size
+        self.min_cells = min_cells
+        self.timeout = timeout
+        self._pool = None
+        self._lock = threading.Lock()
+        self.offloaded = 0
+        self.inline = 0
+
+    def _get_pool(self):
+        with self._lock:
+            if self._pool is None:
+                # Workers start lazily on first submit; keep the script path hidden then
+                self._pool = ProcessPoolExecutor(max_workers=self.size, mp_context=process_context())
+            return self._pool
+
+    def _reset(self, pool, kill=False):
+        with self._lock:
+            if self._pool is pool:
+                self._pool = None
+        if kill:
+            # shutdown() doesn't stop a task that is already running
+            for process in list((pool._processes or {}).values()):
+                process.terminate()
+        pool.shutdown(wait=False, cancel_futures=True)
+
+    def _count(self, offloaded: bool):
+        with self._lock:
+            if offloaded:
+                self.offloaded += 1
+            else:
+                self.inline += 1
+
+    def should_offload(self, fn, df: pd.DataFrame):
+        return self.size > 0 and fn.__name__ in OFFLOADED and df.size >= self.min_cells
+
+    def run(self, fn, df: pd.DataFrame, name: str = None):
+        """
+        Returns fn(df), computed in a worker process when worthwhile.
+        `name` labels the timing series (default: the function's name).
+        """
+        with timer("analyzer", name or fn.__name__):
+            return self._run(fn, df)
+
+    def _run(self, fn, df):
+        if not self.should_offload(fn, df):
+            self._count(False)
+            return fn(df)
+
+        pool = self._get_pool()
+        try:
+            with shared_frames.use(df) as frame_name:
+                with without_main_path():
+                    future = pool.submit(_run_analysis, frame_name, fn.__name__)
+                try:
+                    result = future.result(timeout=self.timeout)
+                except TimeoutError:
+                    # Running it inline would just block this thread as long; replace the pool instead
+                    print(f"Analysis worker ran {fn.__name__} past {self.timeout:g}s; restarting pool.")
+                    self._reset(pool, kill=True)
+                    raise TimeoutError(f"{fn.__name__} timed out after {self.timeout:g} seconds")
+            self._count(True)
+            return result
+        except BrokenProcessPool as e:
+            print(f"Analysis worker died ({e}); restarting pool and running {fn.__name__} inline.")
+            self._reset(pool)
+        except FileNotFoundError:
+            # The segment was released (pool shutdown) before the worker attached
+            pass
+
+        self._count(False)
+        return fn(df)
+
+    def shutdown(self):
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(wait=False, cancel_futures=True)
+
+    def stats(self):
+        return {"workers": self.size, "offloaded": self.offloaded, "inline": self.inline}
+
+
+# Singleton instance
+analysis_pool = AnalysisPool()
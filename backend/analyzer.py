@@ -1,13 +1,26 @@
 import pandas as pd
 import numpy as np
 import math
-import matplotlib
-matplotlib.use('Agg') # Non-interactive backend
-import matplotlib.pyplot as plt
-import seaborn as sns
 import io
 import base64
 
+# Failure label columns, in order of preference
+TARGET_COLUMNS = ["Machine failure", "Failure", "Target", "failure", "target"]
+
+def find_target_column(df: pd.DataFrame):
+    return next((c for c in TARGET_COLUMNS if c in df.columns), None)
+
+def load_plotting():
+    """
+    Imports matplotlib (non-interactive backend) and seaborn on first use;
+    together they add ~0.5s to startup otherwise.
+    """
+    import matplotlib
+    matplotlib.use('Agg') # Non-interactive backend
+    import matplotlib.pyplot as plt
+    import seaborn as sns
+    return plt, sns
+
 def clean_for_json(obj):
     """
     Recursively clean dictionary/list for JSON serialization.
@@ -30,6 +43,7 @@ def clean_for_json(obj):
     return obj
 
 def plot_to_base64(fig):
+    plt, _ = load_plotting()
     buf = io.BytesIO()
     fig.savefig(buf, format='png', bbox_inches='tight')
     buf.seek(0)
@@ -38,6 +52,7 @@ def plot_to_base64(fig):
     return img_str
 
 def generate_plots(df: pd.DataFrame):
+    plt, sns = load_plotting()
     plots = {}
     numeric_cols = df.select_dtypes(include=[np.number]).columns.tolist()
     
@@ -66,8 +81,7 @@ def auto_eda(df: pd.DataFrame):
     # Basic Info
     # Calculate true failures for EDA
     failure_count = 0
-    possible_cols = ["Machine failure", "Failure", "Target", "failure", "target"]
-    found_col = next((c for c in possible_cols if c in df.columns), None)
+    found_col = find_target_column(df)
     
     if found_col:
         failure_count = int(df[found_col].sum())
@@ -140,8 +154,7 @@ def get_failure_stats(df: pd.DataFrame):
     """
     Returns raw dictionary of failure statistics.
     """
-    possible_cols = ["Machine failure", "Failure", "Target", "failure", "target"]
-    target_col = next((c for c in possible_cols if c in df.columns), None)
+    target_col = find_target_column(df)
     
     if not target_col:
         return {"error": "No target column found"}
@@ -169,8 +182,10 @@ def get_failure_stats(df: pd.DataFrame):
         "modes": modes
     }
 
-def analyze_failure_modes(df: pd.DataFrame):
-    stats = get_failure_stats(df)
+def analyze_failure_modes(df: pd.DataFrame, stats: dict = None):
+    # Callers that already have get_failure_stats(df) can pass it in
+    if stats is None:
+        stats = get_failure_stats(df)
     if "error" in stats:
         return "No specific failure label column identified. Cannot categorize failures automatically."
         
@@ -200,8 +215,7 @@ def get_correlation_stats(df: pd.DataFrame):
     """
     Returns raw correlation data.
     """
-    possible_cols = ["Machine failure", "Failure", "Target", "failure", "target"]
-    target_col = next((c for c in possible_cols if c in df.columns), None)
+    target_col = find_target_column(df)
     
     if not target_col:
         return {"error": "No target column"}
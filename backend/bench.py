@@ -0,0 +1,330 @@
+"""
+Micro-benchmarks for the analyzer, serialization and reporting hot paths.
+
+Generates synthetic AI4I-style failure datasets (the columns of the saved
+reports: UDI, Product ID, Type, temperatures, speed, torque, tool wear,
+Machine failure and TWF/HDF/PWF/OSF/RNF, padded with extra sensor columns
+up to the requested width), times each function on them and compares the
+best time against the stored baselines in bench_baseline.json. A case
+slower than its baseline by more than the regression threshold fails the
+run (exit status 1).
+
+    python bench.py                                  # default shapes vs. baseline
+    python bench.py --shapes 1mx14,100kx1000
+    python bench.py --full                           # 10k-10m rows x 10-1000 columns
+    python bench.py --only auto_eda,get_failures --repeat 5
+    python bench.py --save-baseline                  # record this machine's timings
+
+Baselines are machine specific; record them on the machine you compare on.
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import platform
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+os.environ.setdefault("MPLBACKEND", "Agg")
+
+import analyzer
+import reporting
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+BASELINE_FILE = os.path.join(BACKEND_DIR, "bench_baseline.json")
+
+# rows x columns; --full runs every combination of FULL_ROWS and FULL_COLUMNS
+DEFAULT_SHAPES = "10kx14,100kx14,1mx14,10kx100,100kx100"
+FULL_ROWS = "10k,100k,1m,10m"
+FULL_COLUMNS = "10,100,1000"
+# Allowed slowdown over baseline before a case counts as a regression
+REGRESSION_THRESHOLD = 0.25
+THRESHOLDS = {
+    "generate_plots": 0.40,  # rendering and PNG encoding are noisier
+    "list_reports": 0.40,  # file system bound
+}
+# Differences below this are timer and scheduler noise, never regressions
+MIN_REGRESSION_SECONDS = 0.005
+# Skip shapes that would not fit in memory (10M rows x 1000 columns is ~80 GB)
+BENCH_MAX_CELLS = int(float(os.getenv("BENCH_MAX_CELLS", "2e8")))
+# The annotated heatmap grows with columns squared (~20s at 100 columns)
+BENCH_PLOT_MAX_COLUMNS = int(os.getenv("BENCH_PLOT_MAX_COLUMNS", "100"))
+# One run this slow is stable enough; don't repeat it
+MAX_REPEAT_SECONDS = 5.0
+# Saved reports present when timing list_reports
+BENCH_REPORTS = 100
+
+# AI4I 2020 columns in dataset order
+AI4I_COLUMNS = [
+    "UDI", "Product ID", "Type", "Air temperature [K]", "Process temperature [K]",
+    "Rotational speed [rpm]", "Torque [Nm]", "Tool wear [min]",
+    "Machine failure", "TWF", "HDF", "PWF", "OSF", "RNF",
+]
+# Kept first when fewer columns are requested: the target and sensors before flags
+NARROW_ORDER = [
+    "UDI", "Type", "Air temperature [K]", "Process temperature [K]", "Rotational speed [rpm]",
+    "Torque [Nm]", "Tool wear [min]", "Machine failure", "TWF", "HDF", "PWF", "OSF", "RNF", "Product ID",
+]
+
+
+def parse_count(text: str) -> int:
+    """
+    "10k" -> 10000, "1m" -> 1000000, "250" -> 250.
+    """
+    text = text.strip().lower()
+    scale = {"k": 1_000, "m": 1_000_000}.get(text[-1:], 1)
+    return int(float(text[:-1] if scale > 1 else text) * scale)
+
+
+def label_count(n: int) -> str:
+    if n >= 1_000_000 and n % 1_000_000 == 0:
+        return f"{n // 1_000_000}m"
+    if n >= 1_000 and n % 1_000 == 0:
+        return f"{n // 1_000}k"
+    return str(n)
+
+
+def make_dataset(rows: int, columns: int = 14, seed: int = 42) -> pd.DataFrame:
+    """
+    Synthetic AI4I-style dataset. Failure flags follow the AI4I rules
+    (heat dissipation, power, overstrain, tool wear windows, plus ~0.1%
+    random failures), so failure rates and correlations look like the real
+    data (~4-5% failures).
+    """
+    rng = np.random.default_rng(seed)
+    kind = rng.choice(np.array(["L", "M", "H"]), rows, p=[0.5, 0.3, 0.2])
+    air = rng.normal(300, 2, rows)
+    process = air + 10 + rng.normal(0, 1, rows)
+    speed = np.clip(rng.normal(1540, 180, rows), 1160, 2890).round()
+    # Torque falls as speed rises (roughly constant power), as in the real data
+    omega = speed * 2 * np.pi / 60
+    torque = np.clip(rng.normal(6300, 1000, rows) / omega, 3, 77).round(1)
+    wear = rng.integers(0, 254, rows)
+
+    power = torque * omega
+    strain_limit = np.select([kind == "L", kind == "M"], [11000, 12000], 13000)
+    twf = (wear >= 200) & (wear <= 240) & (rng.random(rows) < 0.03)
+    hdf = ((process - air) < 8.6) & (speed < 1380)
+    pwf = (power < 3500) | (power > 9000)
+    osf = wear * torque > strain_limit
+    rnf = rng.random(rows) < 0.001
+    failure = twf | hdf | pwf | osf | rnf
+
+    udi = np.arange(1, rows + 1)
+    data = {
+        "UDI": udi,
+        "Product ID": pd.Series(kind).str.cat((udi % 90000 + 10000).astype(str)),
+        "Type": kind,
+        "Air temperature [K]": air.round(1),
+        "Process temperature [K]": process.round(1),
+        "Rotational speed [rpm]": speed.astype(int),
+        "Torque [Nm]": torque,
+        "Tool wear [min]": wear,
+        "Machine failure": failure.astype(int),
+        "TWF": twf.astype(int),
+        "HDF": hdf.astype(int),
+        "PWF": pwf.astype(int),
+        "OSF": osf.astype(int),
+        "RNF": rnf.astype(int),
+    }
+    keep = set(NARROW_ORDER[:columns])
+    df = pd.DataFrame({name: data[name] for name in AI4I_COLUMNS if name in keep})
+    # Wider than AI4I: extra sensor channels
+    extra = columns - df.shape[1]
+    if extra > 0:
+        sensors = rng.normal(0, 1, (rows, extra)).astype(np.float64)
+        df = pd.concat([df, pd.DataFrame(sensors, columns=[f"Sensor {i + 1}" for i in range(extra)])], axis=1)
+    return df
+
+
+# --- Cases: name -> (setup(df) -> state, run(state)) ---
+
+def _setup_frame(df):
+    return df
+
+
+def _setup_clean(df):
+    # What the API serializes: an EDA result plus a /data page of records
+    return {"eda": analyzer.auto_eda(df), "rows": df.head(1000).to_dict(orient="records")}
+
+
+def _setup_reports_dir(df):
+    return {"df": df, "dir": tempfile.mkdtemp(prefix="bench_reports_")}
+
+
+def _setup_listing(df):
+    state = _setup_reports_dir(df)
+    reporting.REPORTS_DIR = state["dir"]
+    for i in range(BENCH_REPORTS):
+        reporting.save_report(df, f"Machine {i}", "Benchmark")
+    return state
+
+
+def _save_report(state):
+    reporting.REPORTS_DIR = state["dir"]
+    return reporting.save_report(state["df"], "Benchmark Machine", "Benchmark")
+
+
+def _list_reports(state):
+    reporting.REPORTS_DIR = state["dir"]
+    return reporting.list_reports()
+
+
+CASES = {
+    "auto_eda": (_setup_frame, analyzer.auto_eda),
+    "get_failure_stats": (_setup_frame, analyzer.get_failure_stats),
+    "get_correlation_stats": (_setup_frame, analyzer.get_correlation_stats),
+    "generate_plots": (_setup_frame, analyzer.generate_plots),
+    "clean_for_json": (_setup_clean, analyzer.clean_for_json),
+    "get_failures": (_setup_frame, reporting.get_failures),
+    "save_report": (_setup_reports_dir, _save_report),
+    "list_reports": (_setup_listing, _list_reports),
+}
+
+
+def time_case(name, df, repeat):
+    setup, run = CASES[name]
+    original_dir = reporting.REPORTS_DIR
+    state = None
+    try:
+        state = setup(df)
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            run(state)
+            timings.append(time.perf_counter() - start)
+            if timings[-1] > MAX_REPEAT_SECONDS:
+                break
+    finally:
+        reporting.REPORTS_DIR = original_dir
+        if isinstance(state, dict) and "dir" in state:
+            shutil.rmtree(state["dir"], ignore_errors=True)
+    return min(timings), sorted(timings)[len(timings) // 2]
+
+
+def case_key(name, rows, columns):
+    return f"{name}/{label_count(rows)}x{columns}"
+
+
+def parse_shapes(text: str):
+    """
+    "10kx14,1mx100" -> [(10000, 14), (1000000, 100)].
+    """
+    shapes = []
+    for item in text.split(","):
+        rows, _, columns = item.strip().lower().partition("x")
+        shapes.append((parse_count(rows), parse_count(columns)))
+    return shapes
+
+
+def load_baseline(path=BASELINE_FILE):
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f).get("results", {})
+
+
+def save_baseline(results, path=BASELINE_FILE):
+    existing = load_baseline(path)
+    existing.update(results)
+    data = {
+        "meta": {
+            "created": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "pandas": pd.__version__,
+            "numpy": np.__version__,
+            "machine": f"{platform.machine()}, {os.cpu_count()} CPUs",
+        },
+        "results": dict(sorted(existing.items())),
+    }
+    with open(path, "w") as f:
+        json.dump(data, f, indent=2)
+        f.write("\n")
+
+
+def compare(key, seconds, baseline, threshold):
+    """
+    Returns (status, ratio) for a timing against its baseline.
+    """
+    base = baseline.get(key)
+    if base is None:
+        return "new", None
+    ratio = seconds / base if base else None
+    if seconds > base * (1 + threshold) and seconds - base > MIN_REGRESSION_SECONDS:
+        return "REGRESSION", ratio
+    if seconds < base * (1 - threshold) and base - seconds > MIN_REGRESSION_SECONDS:
+        return "faster", ratio
+    return "ok", ratio
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark analyzer and reporting hot paths.")
+    parser.add_argument("--shapes", default=DEFAULT_SHAPES, help="comma-separated ROWSxCOLUMNS, e.g. 10kx14,1mx100")
+    parser.add_argument("--full", action="store_true", help=f"rows {FULL_ROWS} x columns {FULL_COLUMNS}")
+    parser.add_argument("--only", default="", help=f"comma-separated cases: {', '.join(CASES)}")
+    parser.add_argument("--repeat", type=int, default=3, help="runs per case; the best is compared")
+    parser.add_argument("--threshold", type=float, default=None,
+                        help=f"allowed slowdown (default {REGRESSION_THRESHOLD}, per-case overrides apply)")
+    parser.add_argument("--save-baseline", action="store_true", help="store these timings as the baseline")
+    parser.add_argument("--baseline", default=BASELINE_FILE)
+    args = parser.parse_args()
+
+    names = [n.strip() for n in args.only.split(",") if n.strip()] or list(CASES)
+    unknown = [n for n in names if n not in CASES]
+    if unknown:
+        parser.error(f"Unknown cases: {', '.join(unknown)}. Choose from: {', '.join(CASES)}")
+
+    if args.full:
+        shapes = [(parse_count(r), parse_count(c)) for r in FULL_ROWS.split(",") for c in FULL_COLUMNS.split(",")]
+    else:
+        shapes = parse_shapes(args.shapes)
+
+    # Untimed pass so lazy imports (matplotlib, seaborn) don't land on the first case
+    warm = make_dataset(1000, 14)
+    for name in names:
+        time_case(name, warm, 1)
+
+    baseline = load_baseline(args.baseline)
+    results = {}
+    regressions = []
+    print(f"{'case':<40} {'best':>9} {'median':>9} {'baseline':>9}  status")
+    for rows, columns in shapes:
+        if rows * columns > BENCH_MAX_CELLS:
+            print(f"# {label_count(rows)}x{columns}: skipped ({rows * columns:,} cells > BENCH_MAX_CELLS)")
+            continue
+        start = time.perf_counter()
+        df = make_dataset(rows, columns)
+        print(f"# {label_count(rows)} rows x {columns} columns "
+              f"(generated in {time.perf_counter() - start:.1f}s, "
+              f"{df.memory_usage(deep=True).sum() / 1e6:.0f} MB)")
+        for name in names:
+            key = case_key(name, rows, columns)
+            if name == "generate_plots" and columns > BENCH_PLOT_MAX_COLUMNS:
+                print(f"{key:<40} skipped (> BENCH_PLOT_MAX_COLUMNS)")
+                continue
+            best, median = time_case(name, df, args.repeat)
+            results[key] = round(best, 6)
+            threshold = args.threshold if args.threshold is not None else THRESHOLDS.get(name, REGRESSION_THRESHOLD)
+            status, ratio = compare(key, best, baseline, threshold)
+            if status == "REGRESSION":
+                regressions.append(key)
+            base = f"{baseline[key]:.4f}" if key in baseline else "-"
+            detail = f" ({ratio:.2f}x)" if ratio else ""
+            print(f"{key:<40} {best:>9.4f} {median:>9.4f} {base:>9}  {status}{detail}")
+        del df
+
+    if args.save_baseline:
+        save_baseline(results, args.baseline)
+        print(f"\nSaved {len(results)} baselines to {args.baseline}")
+    elif regressions:
+        print(f"\n{len(regressions)} regression(s): {', '.join(regressions)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,175 @@
+import os
+import re
+
+import numpy as np
+import pandas as pd
+
+from lexical import tokenize
+from analyzer import TARGET_COLUMNS
+
+# --- PROMPT BUDGET ---
+# Approximate tokens for the data context of one prompt (system prompt excluded)
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "600"))
+# Background failure report (modes, definitions, correlations, manual excerpts)
+REPORT_TOKEN_BUDGET = int(os.getenv("REPORT_TOKEN_BUDGET", "1200"))
+CONTEXT_MAX_COLUMNS = int(os.getenv("CONTEXT_MAX_COLUMNS", "12"))
+EXCERPT_MAX_CHARS = int(os.getenv("EXCERPT_MAX_CHARS", "400"))
+
+_SENTENCE_RE = re.compile(r"(?<=[.!?])\s+")
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Rough token count (~4 characters per token for English/BPE models).
+    Good enough for budgeting; no tokenizer dependency.
+    """
+    return (len(text) + 3) // 4
+
+
+def relevant_columns(df: pd.DataFrame, question: str = "", prefer=(), limit: int = CONTEXT_MAX_COLUMNS):
+    """
+    Picks the columns worth describing for a question, most relevant first:
+    columns named in the question, then `prefer` (e.g. correlated features),
+    the failure target and failure mode flags, then the remaining columns in
+    dataset order, up to `limit`.
+    """
+    prefer = {col: rank for rank, col in reversed(list(enumerate(prefer)))}
+    terms = set(tokenize(question))
+    lowered = question.lower()
+
+    def score(col):
+        name = str(col)
+        if name.lower() in lowered:
+            return 3
+        if terms & set(tokenize(name)):
+            return 2
+        if col in prefer or name in TARGET_COLUMNS or (name.isupper() and len(name) <= 4):
+            return 1
+        return 0
+
+    ranked = sorted(enumerate(df.columns), key=lambda item: (-score(item[1]), prefer.get(item[1], len(prefer)), item[0]))
+    return [col for _, col in ranked[:limit]]
+
+
+def _fmt(value):
+    if isinstance(value, (float, np.floating)):
+        return f"{value:.4g}"
+    return str(value)
+
+
+def column_lines(df: pd.DataFrame, columns):
+    """
+    One compact line per column: dtype plus range (numeric) or a sample value.
+    """
+    lines = []
+    for col in columns:
+        series = df[col]
+        if pd.api.types.is_numeric_dtype(series) and series.notna().any():
+            lines.append(f"- {col} ({series.dtype}): {_fmt(series.min())}..{_fmt(series.max())}")
+        else:
+            sample = series.dropna().iloc[0] if series.notna().any() else None
+            lines.append(f"- {col} ({series.dtype}): e.g. {_fmt(sample)[:40]}")
+    return lines
+
+
+def top_shifts(stats: dict):
+    return sorted(stats.get("shifts", []), key=lambda s: abs(s["pct_diff"]), reverse=True)
+
+
+def correlation_lines(stats: dict, limit: int = 5):
+    """
+    Compact form of get_correlation_stats output: top correlations, then the
+    largest failure-vs-normal shifts.
+    """
+    if not stats or "error" in stats:
+        return []
+    lines = [f"- corr({item['feature']}, failure) = {item['value']:.2f}"
+             for item in stats.get("top_correlations", [])[:limit]]
+    for item in top_shifts(stats)[:limit]:
+        direction = "higher" if item["pct_diff"] > 0 else "lower"
+        lines.append(f"- {item['feature']}: {abs(item['pct_diff']):.1f}% {direction} during failure")
+    return lines
+
+
+def _sentences(text: str):
+    return _SENTENCE_RE.split(" ".join(text.split()))
+
+
+def dedupe_excerpts(excerpts, seen=(), max_chars: int = EXCERPT_MAX_CHARS, threshold: float = 0.8):
+    """
+    Drops manual excerpts that repeat an earlier one or a text in `seen`
+    (token overlap above `threshold`), removes sentences already seen and
+    trims each excerpt to `max_chars` at a sentence boundary.
+    """
+    kept = []
+    kept_terms = [terms for terms in (set(tokenize(text)) for text in seen if text) if terms]
+    seen_sentences = {s.lower() for text in seen if text for s in _sentences(text)}
+    for text in excerpts:
+        terms = set(tokenize(text))
+        if not terms:
+            continue
+        if any(len(terms & other) / min(len(terms), len(other)) >= threshold for other in kept_terms):
+            continue
+
+        sentences = []
+        for sentence in _sentences(text):
+            key = sentence.lower()
+            if key in seen_sentences:
+                continue
+            seen_sentences.add(key)
+            sentences.append(sentence)
+
+        trimmed = ""
+        for sentence in sentences:
+            if trimmed and len(trimmed) + len(sentence) + 1 > max_chars:
+                break
+            trimmed = f"{trimmed} {sentence}".strip()
+        if trimmed:
+            kept.append(trimmed[:max_chars])
+            kept_terms.append(terms)
+    return kept
+
+
+class ContextBuilder:
+    """
+    Assembles prompt context under a token budget.
+    Sections are filled in priority order (lower first); each section's lines
+    should be ordered most relevant first, since lines are dropped from the
+    end once the budget is reached. Output keeps the order sections were added.
+    """
+
+    def __init__(self, budget: int = CONTEXT_TOKEN_BUDGET):
+        self.budget = budget
+        self._sections = []  # (priority, title, lines)
+        self.stats = {}
+
+    def add(self, title: str, lines, priority: int = 1):
+        lines = [line for line in lines if line]
+        if lines:
+            self._sections.append((priority, title, lines))
+        return self
+
+    def build(self) -> str:
+        used = 0
+        dropped = 0
+        included = {}
+        for index in sorted(range(len(self._sections)), key=lambda i: self._sections[i][0]):
+            _, title, lines = self._sections[index]
+            cost = estimate_tokens(title) + 1
+            taken = []
+            for line in lines:
+                line_cost = estimate_tokens(line) + 1
+                if used + cost + line_cost > self.budget:
+                    break
+                cost += line_cost
+                taken.append(line)
+            dropped += len(lines) - len(taken)
+            if taken:
+                used += cost
+                included[index] = taken
+
+        text = "\n\n".join(
+            f"{self._sections[i][1]}\n" + "\n".join(included[i]) for i in sorted(included)
+        )
+        self.stats = {"tokens": estimate_tokens(text), "budget": self.budget, "dropped_lines": dropped}
+        return text
@@ -0,0 +1,123 @@
+import os
+import re
+import threading
+from collections import deque
+
+# --- CONVERSATION MEMORY LIMITS (per session) ---
+CONVERSATION_MAX_ENTRIES = int(os.getenv("CONVERSATION_MAX_ENTRIES", "6"))
+CONVERSATION_MAX_BYTES = int(os.getenv("CONVERSATION_MAX_BYTES", "16384"))
+SUMMARY_MAX_CHARS = int(os.getenv("CONVERSATION_SUMMARY_CHARS", "800"))
+
+_SENTENCE_RE = re.compile(r"(?<=[.!?])\s+")
+
+
+def _first_sentence(text: str, max_chars: int):
+    text = " ".join(str(text).split())
+    sentence = _SENTENCE_RE.split(text, 1)[0]
+    return sentence if len(sentence) <= max_chars else sentence[:max_chars - 3] + "..."
+
+
+def _summary_line(turn):
+    return f"- Asked: {_first_sentence(turn['q'], 120)} -> {_first_sentence(turn['a'], 160)}"
+
+
+def _turn_size(turn):
+    return len(turn["q"].encode("utf-8")) + len(turn["a"].encode("utf-8"))
+
+
+class ConversationMemory:
+    """
+    Bounded memory of one session's conversation.
+    Recent turns are kept verbatim up to `max_entries` and `max_bytes`;
+    older turns are compacted into a short extractive summary (question plus
+    the first sentence of the answer), itself capped at SUMMARY_MAX_CHARS
+    by dropping its oldest lines. `on_change` is called after every change,
+    e.g. to share the memory through the state backend (see snapshot()).
+    """
+
+    def __init__(self, max_entries=CONVERSATION_MAX_ENTRIES, max_bytes=CONVERSATION_MAX_BYTES):
+        self.max_entries = max(1, max_entries)
+        self.max_bytes = max_bytes
+        self._turns = deque()
+        self._bytes = 0
+        self._summary = deque()  # one line per compacted turn
+        self.compacted = 0
+        self._lock = threading.Lock()
+        self.on_change = None
+
+    def __len__(self):
+        return len(self._turns)
+
+    def append(self, question: str, answer: str):
+        turn = {"q": str(question), "a": str(answer)}
+        with self._lock:
+            self._turns.append(turn)
+            self._bytes += _turn_size(turn)
+            # Always keep the latest turn, even if it alone exceeds max_bytes
+            while len(self._turns) > 1 and (len(self._turns) > self.max_entries or self._bytes > self.max_bytes):
+                self._compact(self._turns.popleft())
+        self._changed()
+
+    def _compact(self, turn):
+        self._bytes -= _turn_size(turn)
+        self._summary.append(_summary_line(turn))
+        self.compacted += 1
+        while len(self._summary) > 1 and sum(len(line) + 1 for line in self._summary) > SUMMARY_MAX_CHARS:
+            self._summary.popleft()
+
+    def clear(self):
+        with self._lock:
+            self._turns.clear()
+            self._summary.clear()
+            self._bytes = 0
+            self.compacted = 0
+        self._changed()
+
+    def _changed(self):
+        if self.on_change is not None:
+            self.on_change(self)
+
+    def snapshot(self):
+        """
+        JSON-serializable copy of the memory, for restore().
+        """
+        with self._lock:
+            return {"turns": [dict(t) for t in self._turns], "summary": list(self._summary),
+                    "compacted": self.compacted}
+
+    def restore(self, snapshot: dict):
+        with self._lock:
+            self._turns = deque(snapshot.get("turns", []))
+            self._bytes = sum(_turn_size(t) for t in self._turns)
+            self._summary = deque(snapshot.get("summary", []))
+            self.compacted = snapshot.get("compacted", 0)
+
+    def turns(self):
+        with self._lock:
+            return [dict(t) for t in self._turns]
+
+    def context_lines(self, recent: int = 2, answer_chars: int = 300):
+        """
+        Follow-up context for prompts: the last `recent` turns with answers
+        trimmed to `answer_chars`, then one summary line per earlier turn.
+        Newest first, so a token budget trims the oldest lines. Never the
+        full history.
+        """
+        with self._lock:
+            turns = list(self._turns)
+            lines = list(self._summary) + [_summary_line(t) for t in turns[:-recent]]
+            for turn in turns[-recent:]:
+                answer = " ".join(turn["a"].split())
+                if len(answer) > answer_chars:
+                    answer = answer[:answer_chars - 3] + "..."
+                lines.append(f"- Q: {' '.join(turn['q'].split())}\n  A: {answer}")
+        return lines[::-1]
+
+    def stats(self):
+        with self._lock:
+            return {
+                "turns": len(self._turns),
+                "bytes": self._bytes,
+                "compacted_turns": self.compacted,
+                "summary_chars": sum(len(line) + 1 for line in self._summary),
+            }
@@ -0,0 +1,227 @@
+import os
+import time
+import contextvars
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from knowledge import get_kb
+from tools import search_web
+from metrics import timed
+
+# --- LOOKUP LIMITS (seconds) ---
+MANUAL_LOOKUP_TIMEOUT = float(os.getenv("MANUAL_LOOKUP_TIMEOUT", "5"))
+WEB_LOOKUP_TIMEOUT = float(os.getenv("WEB_LOOKUP_TIMEOUT", "8"))
+DEFINITION_DEADLINE = float(os.getenv("DEFINITION_DEADLINE", "12"))
+DEFINITION_WORKERS = int(os.getenv("DEFINITION_WORKERS", "8"))
+# Web lookups in flight at once; one thread stays free for manual lookups
+WEB_LOOKUP_SLOTS = max(1, DEFINITION_WORKERS - 1)
+
+# --- PERSISTENT STORE ---
+DEFINITIONS_DB = os.getenv("DEFINITIONS_DB", os.path.join(os.path.dirname(__file__), "definitions.sqlite3"))
+DEFINITION_TTL = float(os.getenv("DEFINITION_TTL", str(30 * 24 * 3600)))
+NEGATIVE_TTL = float(os.getenv("DEFINITION_NEGATIVE_TTL", str(24 * 3600)))
+
+USER_SOURCE = "User Definition"
+
+
+class DefinitionStore:
+    """
+    SQLite-backed record of every definition lookup, keyed by (name, source).
+    A NULL definition is a cached miss (negative entry). Lookups expire after
+    DEFINITION_TTL (hits) or NEGATIVE_TTL (misses); user definitions never
+    expire. Manual entries are dropped whenever the manual index changes.
+    """
+
+    def __init__(self, path=DEFINITIONS_DB):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS definitions (
+                    name TEXT NOT NULL,
+                    source TEXT NOT NULL,
+                    definition TEXT,
+                    updated_at REAL NOT NULL,
+                    PRIMARY KEY (name, source)
+                )
+            """)
+
+    def get(self, name: str, source: str):
+        """
+        Returns (cached, definition). cached is False when there is no fresh
+        entry, in which case the source has to be queried.
+        """
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT definition, updated_at FROM definitions WHERE name = ? AND source = ?",
+                (name, source)
+            ).fetchone()
+        if row is None:
+            return False, None
+        definition, updated_at = row
+        if source != USER_SOURCE:
+            ttl = DEFINITION_TTL if definition else NEGATIVE_TTL
+            if time.time() - updated_at > ttl:
+                return False, None
+        return True, definition
+
+    def put(self, name: str, source: str, definition):
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO definitions (name, source, definition, updated_at) VALUES (?, ?, ?, ?)",
+                (name, source, definition or None, time.time())
+            )
+
+    def invalidate(self, source: str):
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM definitions WHERE source = ?", (source,))
+
+    def acronyms(self):
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT name, definition FROM definitions WHERE source = ? AND definition IS NOT NULL",
+                (USER_SOURCE,)
+            ).fetchall()
+        return dict(rows)
+
+    def set_acronyms(self, acronyms: dict):
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO definitions (name, source, definition, updated_at) VALUES (?, ?, ?, ?)",
+                [(name, USER_SOURCE, definition, now) for name, definition in acronyms.items()]
+            )
+
+
+# Singleton instance
+definition_store = DefinitionStore()
+
+# Shared so lookups that outlive their timeout can't pile up unbounded threads
+_lookup_pool = ThreadPoolExecutor(max_workers=DEFINITION_WORKERS, thread_name_prefix="definition")
+_web_slots = threading.BoundedSemaphore(WEB_LOOKUP_SLOTS)
+
+
+@timed("definitions", "manuals")
+def _lookup_manuals(names):
+    """
+    One batched retrieval for all names. Returns {name: definition or None}.
+    """
+    # Errors propagate so an unreachable index isn't cached as "no definition"
+    hits = get_kb().search_many([f"What does failure mode {name} mean?" for name in names], k=1, raise_errors=True)
+    return {name: (h[0]["text"] if h else None) for name, h in zip(names, hits)}
+
+
+@timed("definitions", "web_search")
+def _lookup_web(names):
+    results = {}
+    for name in names:
+        # Errors propagate so a network blip isn't cached as "no definition"
+        web_res = search_web(f"meaning of {name} failure mode reliability engineering",
+                             timeout=WEB_LOOKUP_TIMEOUT, raise_errors=True)
+        results[name] = web_res[:200] if web_res else None
+    return results
+
+
+def resolve_definitions(names, acronyms: dict, deadline: float = DEFINITION_DEADLINE):
+    """
+    Resolves failure mode names to (definition, source) concurrently.
+    Source priority per name is unchanged: Manuals, then User Definition,
+    then Web Search. Fresh entries in the definition store (including
+    cached misses) answer without querying the source. Manual lookups for
+    all uncached names are one batched retrieval (KnowledgeBase.search_many);
+    a web lookup starts as soon as its name misses in the manuals and
+    acronyms.
+    Each source has its own timeout and the whole call returns by `deadline`;
+    names still unresolved then map to (None, None).
+    """
+    names = list(dict.fromkeys(names))
+    results = {name: (None, None) for name in names}
+    if not names:
+        return results
+
+    start = time.time()
+    end = start + deadline
+    pending = {}  # future -> (names, source, started_at, timeout)
+
+    def record(source):
+        # Store whatever the lookup returns, even if it finishes after its timeout
+        def done(future):
+            if future.exception() is None:
+                for name, definition in future.result().items():
+                    definition_store.put(name, source, definition)
+        return done
+
+    def query(names, source):
+        todo = []
+        for name in names:
+            cached, definition = definition_store.get(name, source)
+            if not cached:
+                todo.append(name)
+            elif definition:
+                results[name] = (definition, source)
+            else:
+                fall_back(name, source)
+        if not todo:
+            return
+        fn, timeout = (_lookup_manuals, MANUAL_LOOKUP_TIMEOUT) if source == "Manuals" else (_lookup_web, WEB_LOOKUP_TIMEOUT)
+        if source == "Web Search":
+            if not _web_slots.acquire(blocking=False):
+                # Earlier searches still hold the threads; don't queue behind them
+                print(f"Web Search lookup for {', '.join(todo)} skipped: {WEB_LOOKUP_SLOTS} searches in flight")
+                return
+        # Run in the caller's context so the lookup's spans land in its trace
+        future = _lookup_pool.submit(contextvars.copy_context().run, fn, todo)
+        future.add_done_callback(record(source))
+        if source == "Web Search":
+            future.add_done_callback(lambda _: _web_slots.release())
+        pending[future] = (todo, source, time.time(), timeout)
+
+    def fall_back(name, source):
+        # Move on to the next source after a miss, error or timeout
+        if source == "Manuals":
+            if name in acronyms:
+                results[name] = (acronyms[name], USER_SOURCE)
+            else:
+                # One web lookup per name so a slow one can't hold up the rest
+                query([name], "Web Search")
+
+    # All manual lookups share a single batched retrieval
+    query(names, "Manuals")
+
+    while pending:
+        now = time.time()
+        if now >= end:
+            break
+        next_expiry = min(started + timeout for _, _, started, timeout in pending.values())
+        done, _ = wait(list(pending), timeout=max(0, min(end, next_expiry) - now), return_when=FIRST_COMPLETED)
+
+        for future in done:
+            todo, source, _, _ = pending.pop(future)
+            try:
+                found = future.result()
+            except Exception as e:
+                print(f"{source} lookup for {', '.join(todo)} failed: {e}")
+                found = {}
+            for name in todo:
+                if found.get(name):
+                    results[name] = (found[name], source)
+                else:
+                    fall_back(name, source)
+
+        now = time.time()
+        for future, (todo, source, started, timeout) in list(pending.items()):
+            if now - started >= timeout:
+                print(f"{source} lookup for {', '.join(todo)} timed out after {timeout:g}s")
+                del pending[future]
+                for name in todo:
+                    fall_back(name, source)
+
+    for todo, source, _, _ in pending.values():
+        print(f"{source} lookup for {', '.join(todo)} missed the {deadline:g}s deadline")
+        for name in todo:
+            if source == "Manuals" and name in acronyms:
+                results[name] = (acronyms[name], USER_SOURCE)
+
+    return results
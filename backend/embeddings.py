@@ -0,0 +1,121 @@
+import os
+import re
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+# --- EMBEDDING BACKEND ---
+# "ollama" (default, nomic-embed-text over HTTP) or "hashing" (in-process, CPU only)
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "ollama")
+OLLAMA_BASE_URL = os.getenv("OLLAMA_BASE_URL", "http://localhost:11434")
+EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "nomic-embed-text")
+HASHING_DIM = int(os.getenv("HASHING_DIM", "1024"))
+OLLAMA_EMBED_CONCURRENCY = int(os.getenv("EMBED_CONCURRENCY", "4"))
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+
+class EmbeddingBackend:
+    """
+    Interface for KnowledgeBase embedding backends.
+    Implements the LangChain Embeddings methods (embed_documents, embed_query)
+    so it can be handed to Chroma directly, plus a batched embed_queries.
+    Each backend writes to its own Chroma collection, since vectors from
+    different backends are not comparable.
+    """
+
+    name = "base"
+    collection_name = "langchain"
+
+    def embed_documents(self, texts):
+        raise NotImplementedError
+
+    def embed_queries(self, texts):
+        raise NotImplementedError
+
+    def embed_query(self, text):
+        return self.embed_queries([text])[0]
+
+
+class OllamaBackend(EmbeddingBackend):
+    """
+    Embeds through an Ollama server. Uses the default collection, so
+    existing indexes keep working.
+    """
+
+    name = "ollama"
+    collection_name = "langchain"
+
+    def __init__(self, base_url=OLLAMA_BASE_URL, model=EMBEDDING_MODEL, concurrency=OLLAMA_EMBED_CONCURRENCY):
+        from langchain_community.embeddings import OllamaEmbeddings
+        # No connection is made until the first embedding request
+        self._client = OllamaEmbeddings(base_url=base_url, model=model)
+        self.concurrency = max(1, concurrency)
+
+    def embed_documents(self, texts):
+        return self._client.embed_documents(list(texts))
+
+    def embed_queries(self, texts):
+        texts = list(texts)
+        if len(texts) <= 1:
+            return [self._client.embed_query(t) for t in texts]
+        # The client sends one request per text; overlap them
+        with ThreadPoolExecutor(max_workers=min(self.concurrency, len(texts))) as pool:
+            return list(pool.map(self._client.embed_query, texts))
+
+
+class HashingBackend(EmbeddingBackend):
+    """
+    In-process hashing vectorizer: word unigrams and bigrams hashed (CRC32,
+    stable across restarts) into a fixed number of signed buckets, with
+    sublinear term frequency and L2 normalization. No model, no server;
+    lower retrieval quality than a neural model but microsecond latency,
+    which makes it suitable for offline runs and retrieval benchmarks.
+    """
+
+    name = "hashing"
+
+    def __init__(self, dim=HASHING_DIM):
+        self.dim = dim
+        self.collection_name = f"manuals_hashing_{dim}"
+
+    def _features(self, text):
+        tokens = _TOKEN_RE.findall(text.lower())
+        return tokens + [f"{a} {b}" for a, b in zip(tokens, tokens[1:])]
+
+    def _embed(self, texts):
+        rows, cols, signs = [], [], []
+        for row, text in enumerate(texts):
+            for feature in self._features(text):
+                h = zlib.crc32(feature.encode("utf-8"))
+                rows.append(row)
+                cols.append(h % self.dim)
+                signs.append(1.0 if (h >> 31) & 1 else -1.0)
+
+        matrix = np.zeros((len(texts), self.dim), dtype=np.float32)
+        if rows:
+            np.add.at(matrix, (np.array(rows), np.array(cols)), np.array(signs, dtype=np.float32))
+        matrix = np.sign(matrix) * np.log1p(np.abs(matrix))
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        matrix /= np.where(norms == 0, 1.0, norms)
+        return matrix.tolist()
+
+    def embed_documents(self, texts):
+        return self._embed(list(texts))
+
+    def embed_queries(self, texts):
+        return self._embed(list(texts))
+
+
+BACKENDS = {
+    "ollama": OllamaBackend,
+    "hashing": HashingBackend,
+}
+
+
+def get_embedding_backend(name: str = None) -> EmbeddingBackend:
+    name = name or EMBEDDING_BACKEND
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown embedding backend '{name}'. Choose from: {', '.join(BACKENDS)}")
+    return BACKENDS[name]()
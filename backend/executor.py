@@ -1,48 +1,414 @@
+import os
+import pickle
+import struct
+import threading
+import queue
+import weakref
+from collections import OrderedDict
+from multiprocessing import shared_memory
+from functools import lru_cache
+from contextlib import contextmanager
 import pandas as pd
 import numpy as np
 
-def execute_pandas_code(df: pd.DataFrame, code: str):
+from workers import process_context, without_main_path
+
+# --- EXECUTION LIMITS ---
+EXECUTOR_WORKERS = int(os.getenv("EXECUTOR_WORKERS", "2"))
+EXECUTOR_TIMEOUT = float(os.getenv("EXECUTOR_TIMEOUT", "20"))
+# How long a run waits for a free sandbox worker before giving up
+EXECUTOR_QUEUE_TIMEOUT = float(os.getenv("EXECUTOR_QUEUE_TIMEOUT", "30"))
+EXECUTOR_MEMORY_MB = int(os.getenv("EXECUTOR_MEMORY_MB", "2048"))
+# Datasets kept in shared memory at once (the current one plus any still being analyzed)
+SHARED_FRAMES_MAX = int(os.getenv("SHARED_FRAMES_MAX", "2"))
+
+FORBIDDEN_TERMS = ["import os", "import sys", "subprocess", "eval(", "exec(", "open("]
+
+_HEADER = struct.Struct("QQ")  # meta offset, meta length
+_ALIGN = 64
+
+
+def _aligned(offset):
+    return (offset + _ALIGN - 1) // _ALIGN * _ALIGN
+
+
+def _is_raw_column(series):
+    return isinstance(series.dtype, np.dtype) and series.dtype.kind in "biufcmM"
+
+
+class SharedFrame:
     """
-    Executes pandas code generated by LLM on the provided dataframe.
-    Restricts access to dangerous modules.
-    
-    The code is expected to be a snippet that may create variables or do analysis.
-    The last expression's value is typically what we care about, BUT
-    we will rely on variables created in the local scope, or explicitly printing.
-    
-    However, for the agent, we often want updates to the dataframe or a specific result.
-    
-    This executor will:
-    1. Define 'df' in the local scope.
-    2. Execute the code.
-    3. Return a success flag and either the result or error message.
-    """
-    
-    # Simple safety check
-    forbidden = ["import os", "import sys", "subprocess", "eval(", "exec(", "open("]
-    for term in forbidden:
+    Copies a DataFrame into a single shared memory segment, once per dataset.
+    Numeric columns are stored as raw buffers so workers attach them zero-copy;
+    everything else (strings, categoricals, the index) is pickled into the
+    segment alongside the layout.
+    """
+
+    def __init__(self, df: pd.DataFrame):
+        specs = []
+        raw = []
+        offset = _HEADER.size
+        for i in range(df.shape[1]):
+            series = df.iloc[:, i]
+            if _is_raw_column(series):
+                values = np.ascontiguousarray(series.to_numpy())
+                offset = _aligned(offset)
+                specs.append(("raw", values.dtype.str, offset, len(values)))
+                raw.append((offset, values))
+                offset += values.nbytes
+            else:
+                blob = pickle.dumps(series.reset_index(drop=True), protocol=pickle.HIGHEST_PROTOCOL)
+                specs.append(("pickle", None, offset, len(blob)))
+                raw.append((offset, blob))
+                offset += len(blob)
+
+        meta = pickle.dumps({
+            "columns": df.columns,
+            "index": df.index,
+            "specs": specs,
+        }, protocol=pickle.HIGHEST_PROTOCOL)
+        meta_offset = offset
+        size = max(meta_offset + len(meta), 1)
+
+        self.shm = shared_memory.SharedMemory(create=True, size=size)
+        buf = self.shm.buf
+        _HEADER.pack_into(buf, 0, meta_offset, len(meta))
+        for start, item in raw:
+            if isinstance(item, bytes):
+                buf[start:start + len(item)] = item
+            else:
+                target = np.ndarray(item.shape, dtype=item.dtype, buffer=buf, offset=start)
+                target[:] = item
+        buf[meta_offset:meta_offset + len(meta)] = meta
+
+        self.name = self.shm.name
+        self.size = size
+        self.refs = 0  # runs in flight that may still attach by name
+        self.retired = False  # no longer in the registry; unlinked once refs drop to 0
+
+    def release(self):
+        try:
+            self.shm.close()
+            self.shm.unlink()
+        except FileNotFoundError:
+            pass
+
+
+class FrameRegistry:
+    """
+    Holds SharedFrames for the datasets being worked on, one per DataFrame
+    (so per dataset version). Every worker pool (sandbox, analysis)
+    attaches to the same segment, so a dataset is copied into shared memory
+    once, however many pools read it, and work on an older dataset doesn't
+    republish the current one. At most `max_frames` segments are kept; a
+    segment goes once its DataFrame is garbage collected or it's the least
+    recently used. A retired segment is unlinked once no run started through
+    use() still needs it, so a worker never looks up a name that was just
+    taken away.
+    """
+
+    def __init__(self, max_frames=SHARED_FRAMES_MAX):
+        # Reentrant: a DataFrame can be collected (and forgotten) while the lock is held
+        self._lock = threading.RLock()
+        self._frames = OrderedDict()  # id(df) -> (weakref to df, SharedFrame), most recent last
+        self.max_frames = max(1, max_frames)
+
+    def publish(self, df: pd.DataFrame):
+        """
+        Shares `df` and returns its segment name. No-op if already published.
+        """
+        with self._lock:
+            return self._publish(df).name
+
+    def _publish(self, df):
+        key = id(df)
+        item = self._frames.get(key)
+        if item is not None and item[0]() is df:
+            self._frames.move_to_end(key)
+            return item[1]
+        if item is not None:
+            # Same id, but the original frame is gone
+            self._retire(self._frames.pop(key)[1])
+        frame = SharedFrame(df)
+        self._frames[key] = (weakref.ref(df, self._forget), frame)
+        while len(self._frames) > self.max_frames:
+            self._retire(self._frames.popitem(last=False)[1][1])
+        return frame
+
+    def _forget(self, ref):
+        with self._lock:
+            for key, (item_ref, frame) in list(self._frames.items()):
+                if item_ref is ref:
+                    del self._frames[key]
+                    self._retire(frame)
+
+    @staticmethod
+    def _retire(frame):
+        frame.retired = True
+        if frame.refs == 0:
+            # Workers keep their mapping; only the name goes away
+            frame.release()
+
+    @contextmanager
+    def use(self, df: pd.DataFrame):
+        """
+        Publishes `df` and yields its segment name, keeping the segment
+        linked until the block exits even if it's retired meanwhile.
+        """
+        with self._lock:
+            frame = self._publish(df)
+            frame.refs += 1
+        try:
+            yield frame.name
+        finally:
+            with self._lock:
+                frame.refs -= 1
+                if frame.refs == 0 and frame.retired:
+                    frame.release()
+
+    def release(self):
+        with self._lock:
+            while self._frames:
+                self._retire(self._frames.popitem()[1][1])
+
+    def nbytes(self):
+        with self._lock:
+            return sum(frame.size for _, frame in self._frames.values())
+
+
+shared_frames = FrameRegistry()
+
+
+def _attach_frame(name):
+    """
+    Rebuilds the DataFrame published by SharedFrame inside a worker.
+    Raw columns are read-only views over the shared segment.
+    """
+    try:
+        shm = shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        # Python < 3.13 has no track flag; the parent's resource tracker owns cleanup.
+        shm = shared_memory.SharedMemory(name=name)
+
+    buf = shm.buf
+    meta_offset, meta_len = _HEADER.unpack_from(buf, 0)
+    meta = pickle.loads(bytes(buf[meta_offset:meta_offset + meta_len]))
+
+    data = {}
+    for i, (kind, dtype, offset, length) in enumerate(meta["specs"]):
+        if kind == "raw":
+            values = np.ndarray((length,), dtype=np.dtype(dtype), buffer=buf, offset=offset)
+            values.flags.writeable = False
+            data[i] = values
+        else:
+            # Kept as a Series so extension dtypes (str, category) survive
+            data[i] = pickle.loads(bytes(buf[offset:offset + length]))
+
+    df = pd.DataFrame(data, copy=False)
+    df.columns = meta["columns"]
+    df.index = meta["index"]
+    return shm, df
+
+
+def _check_code(code: str):
+    for term in FORBIDDEN_TERMS:
         if term in code:
-            return False, f"Safety violation: Code contains forbidden term '{term}'"
+            return f"Safety violation: Code contains forbidden term '{term}'"
+    return None
+
+
+@lru_cache(maxsize=256)
+def _compile(code: str):
+    return compile(code, "<generated>", "exec")
 
+
+def _run_code(df: pd.DataFrame, code: str):
+    """
+    Runs generated code against `df` and returns (success, result text).
+    The code is expected to assign its answer to a variable named `result`.
+    """
     local_scope = {"df": df, "pd": pd, "np": np}
-    
+
     try:
-        # We wrap execution to capture stdout if needed, but for now let's just run it
-        # and see if it runs.
-        # To get a return value, the code should assign to a variable named 'result'
-        # or we can try to inspect the last line. 
-        # Simpler approach for this agent: The code should just run. 
-        # If it returns a scalar/string/dict, assign it to variable 'result'.
-        
-        exec(code, {}, local_scope)
-        
+        exec(_compile(code), {}, local_scope)
+
         result = local_scope.get("result", "Execution successful (no 'result' variable set)")
-        
+
         # If 'result' is a DataFrame or Series, convert to something JSON serializable or string summary
         if isinstance(result, (pd.DataFrame, pd.Series)):
-           result = result.to_string() # Return string representation for LLM to read
-           
+            result = result.to_string()  # Return string representation for LLM to read
+
         return True, str(result)
-        
+    except MemoryError:
+        return False, "Execution exceeded the memory limit."
     except Exception as e:
         return False, str(e)
+
+
+def _set_memory_limit(limit_bytes):
+    try:
+        import resource
+    except ImportError:
+        return  # Not available on Windows
+    _, hard = resource.getrlimit(resource.RLIMIT_AS)
+    if hard != resource.RLIM_INFINITY:
+        limit_bytes = min(limit_bytes, hard)
+    resource.setrlimit(resource.RLIMIT_AS, (limit_bytes, hard))
+
+
+def _worker_main(conn, memory_mb):
+    """
+    Worker loop: keeps the current dataset attached and executes code snippets
+    sent by the pool until the pipe is closed.
+    """
+    current = None  # (name, shm, df)
+
+    while True:
+        try:
+            msg = conn.recv()
+        except (EOFError, KeyboardInterrupt):
+            break
+        if msg is None:
+            break
+
+        frame_name, code = msg
+        try:
+            if current is None or current[0] != frame_name:
+                if current is not None:
+                    current[2] = None
+                    try:
+                        current[1].close()
+                    except BufferError:
+                        pass
+                shm, df = _attach_frame(frame_name)
+                current = [frame_name, shm, df]
+                if memory_mb > 0:
+                    _set_memory_limit(memory_mb * 1024 * 1024 + shm.size)
+
+            # Shallow copy so added columns don't leak into the next run
+            outcome = _run_code(current[2].copy(deep=False), code)
+        except MemoryError:
+            outcome = (False, "Execution exceeded the memory limit.")
+        except Exception as e:
+            outcome = (False, f"Executor error: {str(e)}")
+
+        conn.send(outcome)
+
+
+class _Worker:
+    def __init__(self, ctx, memory_mb):
+        self.conn, child_conn = ctx.Pipe()
+        self.process = ctx.Process(target=_worker_main, args=(child_conn, memory_mb), daemon=True)
+        with without_main_path():
+            self.process.start()
+        child_conn.close()
+
+    def kill(self):
+        try:
+            self.conn.close()
+        except OSError:
+            pass
+        if self.process.is_alive():
+            self.process.kill()
+        self.process.join(timeout=1)
+
+
+class ExecutorPool:
+    """
+    Pool of pre-started worker processes for LLM-generated pandas code.
+    The active dataset is published once into shared memory; each run only
+    ships the code string. Runs that exceed the wall-clock timeout or the
+    memory limit cost the worker, which is replaced, never the API process.
+    """
+
+    def __init__(self, size=EXECUTOR_WORKERS, timeout=EXECUTOR_TIMEOUT, memory_mb=EXECUTOR_MEMORY_MB,
+                 queue_timeout=EXECUTOR_QUEUE_TIMEOUT):
+        self.size = size
+        self.timeout = timeout
+        self.queue_timeout = queue_timeout
+        self.memory_mb = memory_mb
+        self._idle = queue.Queue()
+        self._lock = threading.Lock()
+        self._started = False
+
+    def start(self):
+        with self._lock:
+            if self._started or self.size <= 0:
+                return
+            ctx = process_context()
+            for _ in range(self.size):
+                self._idle.put(_Worker(ctx, self.memory_mb))
+            self._started = True
+        print(f"Executor pool started with {self.size} workers.")
+
+    def shutdown(self):
+        with self._lock:
+            while not self._idle.empty():
+                worker = self._idle.get_nowait()
+                try:
+                    worker.conn.send(None)
+                except OSError:
+                    pass
+                worker.kill()
+            shared_frames.release()
+            self._started = False
+
+    def publish(self, df: pd.DataFrame):
+        """
+        Makes `df` the dataset workers execute against. No-op if already published.
+        """
+        if self.size <= 0:
+            return None
+        return shared_frames.publish(df)
+
+    def run(self, df: pd.DataFrame, code: str, timeout=None):
+        if timeout is None:
+            timeout = self.timeout
+
+        self.start()
+        with shared_frames.use(df) as frame_name:
+            try:
+                worker = self._idle.get(timeout=self.queue_timeout)
+            except queue.Empty:
+                return False, f"Execution error: no sandbox worker became available within {self.queue_timeout:g} seconds."
+
+            try:
+                worker.conn.send((frame_name, code))
+                if worker.conn.poll(timeout):
+                    outcome = worker.conn.recv()
+                    self._idle.put(worker)
+                    return outcome
+                error = f"Execution timed out after {timeout:g} seconds."
+            except (EOFError, OSError):
+                error = "Execution aborted: worker process died (memory limit exceeded?)."
+
+        # Timed out or crashed: replace the worker
+        worker.kill()
+        self._idle.put(_Worker(process_context(), self.memory_mb))
+        return False, error
+
+
+executor_pool = ExecutorPool()
+
+
+def execute_pandas_code(df: pd.DataFrame, code: str):
+    """
+    Executes pandas code generated by LLM on the provided dataframe.
+    Restricts access to dangerous modules.
+
+    The code should assign its answer to a variable named 'result'.
+    Execution happens in a sandboxed worker process with a wall-clock timeout
+    and memory limit (see ExecutorPool); with EXECUTOR_WORKERS=0 it runs inline.
+
+    Returns a success flag and either the result or error message.
+    """
+
+    # Simple safety check
+    violation = _check_code(code)
+    if violation:
+        return False, violation
+
+    if executor_pool.size <= 0:
+        return _run_code(df, code)
+
+    return executor_pool.run(df, code)
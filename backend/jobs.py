@@ -0,0 +1,240 @@
+import os
+import time
+import uuid
+import threading
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+
+from state import state
+from metrics import timer
+
+# Threads per job kind, so long manual ingests can't hold up an analysis
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+JOB_HISTORY = 100  # finished jobs kept for status queries
+JOB_STATE_TTL = 24 * 3600  # snapshots visible to other worker processes
+
+ACTIVE_STATES = ("queued", "running")
+
+
+class JobCancelled(Exception):
+    pass
+
+
+class Job:
+    """
+    A unit of background work. The job function receives the Job and should
+    wrap its phases in `job.stage(...)`, which records timings, updates
+    progress and raises JobCancelled once cancellation was requested.
+    Cancellation can also come from another process (a flag in the shared
+    state) or from `cancel_check` returning True.
+    """
+
+    def __init__(self, kind: str, key: str, stages=None, cancel_check=None):
+        self.id = str(uuid.uuid4())
+        self.kind = kind
+        self.key = key
+        self.status = "queued"
+        self.planned_stages = list(stages or [])
+        self.stages = []
+        self.progress = 0.0
+        self.message = ""
+        self.error = None
+        self.result = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self._cancel = threading.Event()
+        self.cancel_check = cancel_check
+        self.on_change = None
+        self.on_finish = None  # called once the job ends, however it ends
+
+    @property
+    def active(self):
+        return self.status in ACTIVE_STATES
+
+    @property
+    def cancelled(self):
+        return self._cancel.is_set()
+
+    def cancel(self):
+        self._cancel.set()
+
+    def check_cancelled(self):
+        if not self._cancel.is_set():
+            if state.get(f"job_cancel:{self.id}") or (self.cancel_check is not None and self.cancel_check()):
+                self._cancel.set()
+        if self._cancel.is_set():
+            raise JobCancelled(f"Job {self.id} was cancelled")
+
+    def set_progress(self, fraction: float, message: str = None):
+        self.progress = max(0.0, min(1.0, fraction))
+        if message is not None:
+            self.message = message
+
+    @contextmanager
+    def stage(self, name: str):
+        self.check_cancelled()
+        entry = {"name": name, "status": "running", "seconds": None}
+        self.stages.append(entry)
+        self.message = name
+        start = time.time()
+        try:
+            # Also exported as a histogram, e.g. stage="retrieval" of component="analysis_job"
+            with timer(f"{self.kind}_job", name):
+                yield entry
+            entry["status"] = "done"
+        except JobCancelled:
+            entry["status"] = "cancelled"
+            raise
+        except Exception:
+            entry["status"] = "failed"
+            raise
+        finally:
+            entry["seconds"] = round(time.time() - start, 3)
+            if self.planned_stages:
+                done = sum(1 for s in self.stages if s["status"] == "done")
+                self.progress = min(1.0, done / len(self.planned_stages))
+            if self.on_change is not None:
+                self.on_change(self)
+        self.check_cancelled()
+
+    def to_dict(self):
+        elapsed = None
+        if self.started_at:
+            elapsed = round((self.finished_at or time.time()) - self.started_at, 3)
+        return {
+            "id": self.id,
+            "kind": self.kind,
+            "key": self.key,
+            "status": self.status,
+            "progress": round(self.progress, 3),
+            "message": self.message,
+            "error": self.error,
+            "stages": [dict(s) for s in self.stages],
+            "created_at": self.created_at,
+            "elapsed_seconds": elapsed,
+        }
+
+
+class JobManager:
+    """
+    Runs background jobs on bounded thread pools, one per job kind.
+    Submitting a job whose (kind, key) is already queued or running returns the
+    existing job; with supersede=True, other active jobs of the same kind are
+    asked to cancel (cooperatively, at their next stage boundary).
+    Job snapshots are mirrored to the shared state, so any worker process
+    can report on or cancel a job another one runs.
+    """
+
+    def __init__(self, max_workers=JOB_WORKERS):
+        self.max_workers = max_workers
+        self._executors = {}  # kind -> ThreadPoolExecutor
+        self._jobs = {}
+        self._lock = threading.Lock()
+
+    def submit(self, kind: str, key: str, fn, *args, stages=None, supersede=True, cancel_check=None,
+               on_finish=None, **kwargs):
+        with self._lock:
+            for job in self._jobs.values():
+                if job.kind != kind or not job.active or job.cancelled:
+                    continue
+                if job.key == key:
+                    return job
+                if supersede:
+                    job.cancel()
+
+            job = Job(kind, key, stages=stages, cancel_check=cancel_check)
+            job.on_change = self._publish
+            job.on_finish = on_finish
+            self._jobs[job.id] = job
+            self._prune()
+
+            executor = self._executors.get(kind)
+            if executor is None:
+                executor = self._executors[kind] = ThreadPoolExecutor(
+                    max_workers=self.max_workers, thread_name_prefix=f"job-{kind}"
+                )
+
+        self._publish(job)
+        executor.submit(self._run, job, fn, args, kwargs)
+        return job
+
+    def _publish(self, job):
+        try:
+            state.set(f"job:{job.id}", job.to_dict(), ttl=JOB_STATE_TTL)
+        except Exception as e:
+            print(f"Could not publish job {job.id}: {e}")
+
+    def _run(self, job, fn, args, kwargs):
+        if job.cancelled:
+            # Superseded while queued; other workers must see it finish too
+            job.status = "cancelled"
+            self._finish(job)
+            return
+
+        job.status = "running"
+        job.started_at = time.time()
+        try:
+            job.result = fn(job, *args, **kwargs)
+            job.status = "done"
+            job.progress = 1.0
+        except JobCancelled:
+            job.status = "cancelled"
+        except Exception as e:
+            print(f"Job {job.kind}/{job.id} failed: {e}")
+            job.status = "failed"
+            job.error = str(e)
+        finally:
+            self._finish(job)
+
+    def _finish(self, job):
+        job.finished_at = time.time()
+        self._publish(job)
+        if job.on_finish is not None:
+            try:
+                job.on_finish(job)
+            except Exception as e:
+                print(f"Job {job.kind}/{job.id} cleanup failed: {e}")
+
+    def _prune(self):
+        finished = [j for j in self._jobs.values() if not j.active]
+        if len(finished) > JOB_HISTORY:
+            finished.sort(key=lambda j: j.created_at)
+            for job in finished[:len(finished) - JOB_HISTORY]:
+                del self._jobs[job.id]
+
+    def get(self, job_id: str):
+        return self._jobs.get(job_id)
+
+    def describe(self, job_id: str):
+        """
+        Status dict for a job run by this or any other worker process.
+        """
+        job = self._jobs.get(job_id)
+        if job is not None:
+            return job.to_dict()
+        return state.get(f"job:{job_id}")
+
+    def latest(self, kind: str):
+        jobs = [j for j in self._jobs.values() if j.kind == kind]
+        return max(jobs, key=lambda j: j.created_at) if jobs else None
+
+    def list(self, kind: str = None):
+        jobs = [j for j in self._jobs.values() if kind is None or j.kind == kind]
+        jobs.sort(key=lambda j: j.created_at, reverse=True)
+        return jobs
+
+    def cancel(self, job_id: str):
+        job = self._jobs.get(job_id)
+        if job is not None:
+            job.cancel()
+            return True
+        if state.get(f"job:{job_id}") is None:
+            return False
+        # Running in another process: it checks this flag at its next stage
+        state.set(f"job_cancel:{job_id}", True, ttl=JOB_STATE_TTL)
+        return True
+
+
+# Singleton instance
+job_manager = JobManager()
@@ -1,29 +1,219 @@
 import os
+import re
+import json
+import time
+import hashlib
+import threading
 import warnings
+from contextlib import contextmanager, nullcontext
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
 # Suppress LangChain deprecation warnings to keep logs clean
 warnings.filterwarnings("ignore", category=UserWarning, module="langchain")
 warnings.filterwarnings("ignore", category=DeprecationWarning, module="langchain")
 
-from langchain_community.document_loaders import PyPDFLoader
-from langchain_community.vectorstores import Chroma
-from langchain_community.embeddings import OllamaEmbeddings
-from langchain_text_splitters import RecursiveCharacterTextSplitter
+# LangChain, Chroma and pypdf are imported where used: they take seconds to
+# load and the API should start without them.
+from cache import LRUCache
+from lexical import BM25Index, tokenize, code_tokens
+from embeddings import get_embedding_backend, EmbeddingBackend
+from metrics import timed
+from state import state
 
 # Configuration
 PERSIST_DIRECTORY = os.path.join(os.path.dirname(__file__), "chroma_db")
-EMBEDDING_MODEL = "nomic-embed-text"
+
+# Ingestion throughput
+INGEST_PARSE_WORKERS = int(os.getenv("INGEST_PARSE_WORKERS", str(min(4, os.cpu_count() or 1))))
+INGEST_PAGES_PER_TASK = 25
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "64"))
+EMBED_CONCURRENCY = int(os.getenv("EMBED_CONCURRENCY", "4"))
+
+INGEST_STAGES = ["parse", "split", "embed", "write"]
+
+# Index writes (ingest, clear) hold a lease shared by every worker process
+KB_WRITE_LEASE_TTL = int(os.getenv("KB_WRITE_LEASE_TTL", "600"))
+KB_LEASE_POLL = 0.2
+
+# Chunk IDs since content addressing (sha256 of the text); older chunks were keyed by UUID
+CHUNK_ID_RE = re.compile(r"^[0-9a-f]{64}$")
+
+# Retrieval caches
+QUERY_CACHE_SIZE = int(os.getenv("QUERY_CACHE_SIZE", "512"))
+RRF_K = 60  # reciprocal rank fusion constant
+
+
+def _extract_pages(pdf_path: str, start: int, stop: int):
+    """
+    Extracts text for pages [start, stop). Runs in a worker process.
+    """
+    from pypdf import PdfReader
+    reader = PdfReader(pdf_path)
+    return [(i, reader.pages[i].extract_text() or "") for i in range(start, stop)]
+
+
+def _load_pages(pdf_path: str):
+    """
+    Loads a PDF into one Document per page (same metadata as PyPDFLoader),
+    extracting page ranges in parallel worker processes for large manuals.
+    """
+    from pypdf import PdfReader
+    from langchain_core.documents import Document
+    n_pages = len(PdfReader(pdf_path).pages)
+    ranges = [(i, min(i + INGEST_PAGES_PER_TASK, n_pages)) for i in range(0, n_pages, INGEST_PAGES_PER_TASK)]
+
+    if len(ranges) <= 1 or INGEST_PARSE_WORKERS <= 1:
+        pages = _extract_pages(pdf_path, 0, n_pages)
+    else:
+        from workers import process_context, without_main_path
+        pages = []
+        workers = min(INGEST_PARSE_WORKERS, len(ranges))
+        with without_main_path():
+            pool = ProcessPoolExecutor(max_workers=workers, mp_context=process_context())
+            futures = [pool.submit(_extract_pages, pdf_path, a, b) for a, b in ranges]
+        with pool:
+            for future in futures:
+                pages.extend(future.result())
+
+    return [Document(page_content=text, metadata={"source": pdf_path, "page": i}) for i, text in pages]
+
 
 class KnowledgeBase:
-    def __init__(self):
-        self.embeddings = OllamaEmbeddings(
-            base_url="http://localhost:11434",
-            model=EMBEDDING_MODEL
-        )
-        self.vector_store = Chroma(
+    def __init__(self, embeddings: EmbeddingBackend = None):
+        # Backend chosen by EMBEDDING_BACKEND unless one is passed in
+        self.embeddings = embeddings or get_embedding_backend()
+        self.vector_store = self._open_store()
+        self.n_results = 3 # Default depth
+
+        # Shared with the other worker processes through the state backend:
+        # the manifest (which file content and chunk IDs each manual
+        # contributed) and the index version, bumped on every ingest or clear
+        collection = self.embeddings.collection_name
+        self._manifest_key = f"kb_manifest:{collection}"
+        self._version_key = f"kb_version:{collection}"
+        self._lease_key = f"kb_write:{collection}"
+        # On-disk copy of the manifest, so it survives restarts with the memory backend
+        self.manifest_path = os.path.join(PERSIST_DIRECTORY, f"{collection}.manifest.json")
+
+        # Version this process's caches and collection handle belong to
+        self.index_version = state.get(self._version_key, 0)
+        self._query_embeddings = LRUCache(QUERY_CACHE_SIZE)
+        self._results = LRUCache(QUERY_CACHE_SIZE)
+
+        # Lexical (BM25) index over the same chunks, built lazily
+        self._lexical = None
+        self._lexical_lock = threading.Lock()
+
+        self._drop_legacy_chunks()
+
+    def _open_store(self):
+        from langchain_community.vectorstores import Chroma
+        return Chroma(
+            collection_name=self.embeddings.collection_name,
             persist_directory=PERSIST_DIRECTORY,
             embedding_function=self.embeddings
         )
-        self.n_results = 3 # Default depth
+
+    # ---------------- SHARED STATE ---------------- #
+
+    def _sync(self):
+        """
+        Catches up with index changes made by other worker processes. When
+        the shared version moved, the collection handle is reopened (a clear
+        deletes and recreates the collection) and cached results and the
+        BM25 index are dropped. Returns the current version.
+        """
+        version = state.get(self._version_key, 0)
+        if version != self.index_version:
+            with self._lexical_lock:
+                self.vector_store = self._open_store()
+                self._lexical = None
+            self._results.clear()
+            self.index_version = version
+        return version
+
+    def _bump_index_version(self):
+        # Only called while holding the write lease
+        version = state.get(self._version_key, 0) + 1
+        state.set(self._version_key, version)
+        self.index_version = version
+        self._results.clear()
+
+    @contextmanager
+    def _writing(self):
+        """
+        Serializes index writes across threads and worker processes, starting
+        from the latest shared version.
+        """
+        token = state.acquire(self._lease_key, 1, ttl=KB_WRITE_LEASE_TTL)
+        while token is None:
+            time.sleep(KB_LEASE_POLL)
+            token = state.acquire(self._lease_key, 1, ttl=KB_WRITE_LEASE_TTL)
+        try:
+            self._sync()
+            yield
+        finally:
+            state.release(self._lease_key, token)
+
+    @property
+    def manifest(self):
+        manifest = state.get(self._manifest_key)
+        if manifest is None:
+            # First process up since the state was reset: seed it from disk
+            try:
+                with open(self.manifest_path, "r") as f:
+                    manifest = json.load(f)
+            except (FileNotFoundError, ValueError):
+                manifest = {"manuals": {}}
+            state.set(self._manifest_key, manifest)
+        return manifest
+
+    def _save_manifest(self, manifest):
+        # Only called while holding the write lease
+        state.set(self._manifest_key, manifest)
+        os.makedirs(PERSIST_DIRECTORY, exist_ok=True)
+        tmp_path = f"{self.manifest_path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(manifest, f)
+        os.replace(tmp_path, self.manifest_path)
+
+    def _drop_legacy_chunks(self):
+        """
+        Deletes chunks written before ingestion was content-addressed. They
+        are keyed by random UUIDs, aren't tracked by the manifest and would
+        otherwise stay in the index forever. Runs once per collection.
+        """
+        if self.manifest.get("legacy_dropped"):
+            return
+        try:
+            with self._writing():
+                manifest = self.manifest
+                if manifest.get("legacy_dropped"):
+                    return
+                ids = self.vector_store._collection.get(include=[])["ids"]
+                legacy = [i for i in ids if not CHUNK_ID_RE.match(i)]
+                for i in range(0, len(legacy), 1000):
+                    self.vector_store._collection.delete(ids=legacy[i:i + 1000])
+                if legacy:
+                    print(f"Dropped {len(legacy)} legacy chunks from '{self.embeddings.collection_name}'; "
+                          f"re-upload their manuals to index them again.")
+                    self._bump_index_version()
+                manifest["legacy_dropped"] = True
+                self._save_manifest(manifest)
+        except Exception as e:
+            print(f"Could not drop legacy chunks (will retry next start): {e}")
+
+    @staticmethod
+    def _file_hash(path: str):
+        digest = hashlib.sha256()
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                digest.update(block)
+        return digest.hexdigest()
+
+    @staticmethod
+    def _chunk_id(text: str):
+        # Content-addressed: identical chunks share one vector
+        return hashlib.sha256(text.encode("utf-8")).hexdigest()
 
     def set_depth(self, k: int):
         self.n_results = k
@@ -31,53 +221,253 @@ class KnowledgeBase:
 
     def clear_index(self):
         try:
-            self.vector_store.delete_collection()
-            # Re-init
-            self.vector_store = Chroma(
-                persist_directory=PERSIST_DIRECTORY,
-                embedding_function=self.embeddings
-            )
+            with self._writing():
+                self.vector_store.delete_collection()
+                # Re-init
+                self.vector_store = self._open_store()
+                self._save_manifest({"manuals": {}, "legacy_dropped": True})
+                with self._lexical_lock:
+                    self._lexical = BM25Index()
+                self._bump_index_version()
             return True, "Knowledge Base cleared."
         except Exception as e:
             return False, f"Error clearing KB: {str(e)}"
 
-    def ingest_manual(self, pdf_path: str):
+    def _embed_chunks(self, texts, on_batch=None):
+        """
+        Embeds texts in EMBED_BATCH_SIZE batches, EMBED_CONCURRENCY at a time.
+        """
+        batches = [texts[i:i + EMBED_BATCH_SIZE] for i in range(0, len(texts), EMBED_BATCH_SIZE)]
+        results = [None] * len(batches)
+        with ThreadPoolExecutor(max_workers=max(1, EMBED_CONCURRENCY)) as pool:
+            futures = {pool.submit(self.embeddings.embed_documents, batch): i for i, batch in enumerate(batches)}
+            for done, future in enumerate(as_completed(futures), 1):
+                results[futures[future]] = future.result()
+                if on_batch:
+                    on_batch(done, len(batches))
+        return [vector for batch in results for vector in batch]
+
+    def _write_chunks(self, ids, texts, embeddings, metadatas):
+        """
+        Bulk upserts precomputed vectors, in the largest batches Chroma accepts.
+        """
+        collection = self.vector_store._collection
+        try:
+            max_batch = self.vector_store._client.get_max_batch_size()
+        except Exception:
+            max_batch = 5000
+        for i in range(0, len(ids), max_batch):
+            collection.upsert(
+                ids=ids[i:i + max_batch],
+                embeddings=embeddings[i:i + max_batch],
+                documents=texts[i:i + max_batch],
+                metadatas=metadatas[i:i + max_batch]
+            )
+
+    def ingest_manual(self, pdf_path: str, job=None):
         """
         Loads a PDF manual, splits it into chunks, and stores it in the vector DB.
+        Pages are parsed in parallel and chunks embedded in concurrent batches.
+        Ingestion is incremental: a file already indexed is skipped, chunks are
+        keyed by content hash so only new chunks are embedded, and chunks a
+        revised manual no longer contains are removed.
+        When run as a background job, reports progress per stage.
         """
         if not os.path.exists(pdf_path):
             return False, "File not found."
 
+        def stage(name):
+            return job.stage(name) if job else nullcontext()
+
         try:
-            loader = PyPDFLoader(pdf_path)
-            documents = loader.load()
+            manual = os.path.basename(pdf_path)
+            file_hash = self._file_hash(pdf_path)
+            for name, entry in self.manifest["manuals"].items():
+                if entry["sha256"] == file_hash:
+                    return True, f"Manual already indexed as {name}; nothing to do."
+
+            with stage("parse"):
+                documents = _load_pages(pdf_path)
             
             # Split documents into smaller chunks for better retrieval
-            text_splitter = RecursiveCharacterTextSplitter(
-                chunk_size=1000,
-                chunk_overlap=200
-            )
-            chunks = text_splitter.split_documents(documents)
-            
-            # Add to vector store
-            self.vector_store.add_documents(chunks)
-            self.vector_store.persist()
+            with stage("split"):
+                from langchain_text_splitters import RecursiveCharacterTextSplitter
+                text_splitter = RecursiveCharacterTextSplitter(
+                    chunk_size=1000,
+                    chunk_overlap=200
+                )
+                chunks = {}
+                for c in text_splitter.split_documents(documents):
+                    if c.page_content.strip():
+                        chunks.setdefault(self._chunk_id(c.page_content), c)
+                ids = list(chunks)
+
+                # Chunks already in the index keep their stored embeddings
+                version = self._sync()
+                existing = set(self.vector_store._collection.get(ids=ids, include=[])["ids"]) if ids else set()
+                new_ids = [i for i in ids if i not in existing]
+                texts = [chunks[i].page_content for i in new_ids]
+                metadatas = [chunks[i].metadata for i in new_ids]
+
+            with stage("embed"):
+                def on_batch(done, total):
+                    if job:
+                        job.check_cancelled()
+                        base = INGEST_STAGES.index("embed")
+                        job.set_progress((base + done / total) / len(INGEST_STAGES), f"embed {done}/{total}")
+                embeddings = self._embed_chunks(texts, on_batch)
+
+            # Add the delta to the vector store
+            with stage("write"), self._writing():
+                if self.index_version != version and existing:
+                    # Another worker changed the index meanwhile; embed what it removed
+                    present = set(self.vector_store._collection.get(ids=list(existing), include=[])["ids"])
+                    gone = [i for i in ids if i in existing and i not in present]
+                    new_ids += gone
+                    texts += [chunks[i].page_content for i in gone]
+                    metadatas += [chunks[i].metadata for i in gone]
+                    embeddings += self._embed_chunks([chunks[i].page_content for i in gone])
+                if new_ids:
+                    self._write_chunks(new_ids, texts, embeddings, metadatas)
+
+                manifest = self.manifest
+                previous = set(manifest["manuals"].get(manual, {}).get("chunks", []))
+                still_used = set(ids)
+                for name, entry in manifest["manuals"].items():
+                    if name != manual:
+                        still_used.update(entry["chunks"])
+                stale = list(previous - still_used)
+                if stale:
+                    self.vector_store._collection.delete(ids=stale)
+
+                manifest["manuals"][manual] = {"sha256": file_hash, "chunks": ids}
+                self._save_manifest(manifest)
+
+                with self._lexical_lock:
+                    if self._lexical is not None:
+                        for chunk_id, text in zip(new_ids, texts):
+                            self._lexical.add(chunk_id, text)
+                        for chunk_id in stale:
+                            self._lexical.remove(chunk_id)
+                if new_ids or stale:
+                    self._bump_index_version()
             
-            return True, f"Successfully assimilated {len(chunks)} chunks from manual."
+            return True, (
+                f"Successfully assimilated {len(ids)} chunks from manual "
+                f"({len(new_ids)} embedded, {len(ids) - len(new_ids)} reused, {len(stale)} removed)."
+            )
         except Exception as e:
+            if job and job.cancelled:
+                raise
             return False, f"Error ingesting manual: {str(e)}"
 
+    def _embed_queries(self, queries):
+        """
+        Returns embeddings for all queries, computing only the uncached ones
+        in one batched backend call.
+        """
+        missing = [q for q in dict.fromkeys(queries) if q not in self._query_embeddings]
+        if missing:
+            for query, vector in zip(missing, self.embeddings.embed_queries(missing)):
+                self._query_embeddings.put(query, vector)
+        return [self._query_embeddings.get(q) for q in queries]
+
+    def _lexical_index(self):
+        """
+        BM25 index over the stored chunks, built from Chroma on first use and
+        kept in step by ingest_manual/clear_index afterwards.
+        """
+        with self._lexical_lock:
+            if self._lexical is None:
+                index = BM25Index()
+                stored = self.vector_store._collection.get(include=["documents"])
+                for doc_id, text in zip(stored["ids"], stored["documents"]):
+                    index.add(doc_id, text or "")
+                self._lexical = index
+            return self._lexical
+
+    @staticmethod
+    def _fuse(vector_hits, lexical_hits, k):
+        """
+        Reciprocal rank fusion of vector and BM25 rankings.
+        """
+        fused = {}
+        for rank, (doc_id, text, distance) in enumerate(vector_hits):
+            hit = fused.setdefault(doc_id, {"text": text, "score": 0.0, "distance": None, "bm25": None})
+            hit["distance"] = distance
+            hit["score"] += 1.0 / (RRF_K + rank + 1)
+        for rank, (doc_id, text, bm25) in enumerate(lexical_hits):
+            hit = fused.setdefault(doc_id, {"text": text, "score": 0.0, "distance": None, "bm25": None})
+            hit["bm25"] = bm25
+            hit["score"] += 1.0 / (RRF_K + rank + 1)
+        return sorted(fused.values(), key=lambda h: h["score"], reverse=True)[:k]
+
+    @timed("rag", "search")
+    def search_many(self, queries, k=None, raise_errors=False):
+        """
+        Retrieves top-k chunks for several queries.
+        Queries naming a code the manuals contain (e.g. "TWF") are answered
+        from the BM25 index alone, without an embedding call. The rest are
+        embedded together, searched in one vector query, and fused with BM25
+        results. Returns one list per query of hits:
+        {"text", "score" (higher = better), "distance" (vector, lower = closer),
+        "bm25"}. Results are cached per (query, k, index version), so any
+        ingest or clear invalidates them. Errors yield empty hits unless
+        raise_errors is set.
+        """
+        if k is None: k = self.n_results
+        version = self._sync()
+        results = [self._results.get((q, k, version)) for q in queries]
+        todo = list(dict.fromkeys(q for q, r in zip(queries, results) if r is None))
+        fresh = {}
+        if todo:
+            try:
+                lexical = self._lexical_index()
+                depth = k * 2  # candidates per ranking before fusion
+
+                dense = []
+                for query in todo:
+                    codes = [t for t in code_tokens(query) if lexical.has_term(t)]
+                    if codes:
+                        fresh[query] = [
+                            {"text": lexical.text(doc_id), "score": score, "distance": None, "bm25": score}
+                            for doc_id, score in lexical.search(codes, k)
+                        ]
+                    else:
+                        dense.append(query)
+
+                if dense:
+                    found = self.vector_store._collection.query(
+                        query_embeddings=self._embed_queries(dense),
+                        n_results=depth,
+                        include=["documents", "distances"]
+                    )
+                    for query, ids, docs, distances in zip(dense, found["ids"], found["documents"], found["distances"]):
+                        lexical_hits = [(i, lexical.text(i), score) for i, score in lexical.search(tokenize(query), depth)]
+                        fresh[query] = self._fuse(list(zip(ids, docs, distances)), lexical_hits, k)
+
+                for query, hits in fresh.items():
+                    self._results.put((query, k, version), hits)
+            except Exception as e:
+                if raise_errors:
+                    raise
+                print(f"RAG Search Error: {e}")
+        return [list(r if r is not None else fresh.get(q, [])) for q, r in zip(queries, results)]
+
     def search_manuals(self, query: str, k=None):
         """
         Retrieves top-k relevant chunks for a given query.
         """
-        if k is None: k = self.n_results
-        try:
-            results = self.vector_store.similarity_search(query, k=k)
-            return [doc.page_content for doc in results]
-        except Exception as e:
-            print(f"RAG Search Error: {e}")
-            return []
+        return [hit["text"] for hit in self.search_many([query], k=k)[0]]
+
+# Singleton instance, created on first use (or by the startup warm-up)
+_kb = None
+_kb_lock = threading.Lock()
 
-# Singleton instance
-kb = KnowledgeBase()
+def get_kb() -> KnowledgeBase:
+    global _kb
+    if _kb is None:
+        with _kb_lock:
+            if _kb is None:
+                _kb = KnowledgeBase()
+    return _kb
@@ -0,0 +1,102 @@
+import re
+import math
+import threading
+from collections import Counter, defaultdict
+
+TOKEN_RE = re.compile(r"[A-Za-z0-9]+")
+# Failure-mode style codes as written in questions: TWF, HDF, PWF, OSF, RNF, M14...
+CODE_RE = re.compile(r"\b(?=[A-Z0-9]*[A-Z])[A-Z0-9]{2,8}\b")
+
+STOPWORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "by", "does", "do", "for", "from",
+    "how", "in", "is", "it", "mean", "of", "on", "or", "the", "this", "to",
+    "what", "when", "which", "why", "with"
+}
+
+
+def tokenize(text: str):
+    return [t for t in (m.lower() for m in TOKEN_RE.findall(text)) if t not in STOPWORDS]
+
+
+def code_tokens(query: str):
+    """
+    Upper-case code tokens in a query (e.g. "TWF"), lower-cased for lookup.
+    """
+    return [t.lower() for t in CODE_RE.findall(query)]
+
+
+class BM25Index:
+    """
+    In-process inverted index with Okapi BM25 scoring over manual chunks.
+    Keyed by the same chunk IDs as the vector store.
+    """
+
+    def __init__(self, k1=1.5, b=0.75):
+        self.k1 = k1
+        self.b = b
+        self._docs = {}  # doc_id -> (text, length)
+        self._postings = defaultdict(dict)  # term -> {doc_id: term frequency}
+        self._total_length = 0
+        self._lock = threading.RLock()
+
+    def __len__(self):
+        return len(self._docs)
+
+    def has_term(self, term: str):
+        return term in self._postings
+
+    def text(self, doc_id):
+        return self._docs[doc_id][0]
+
+    def add(self, doc_id, text: str):
+        with self._lock:
+            if doc_id in self._docs:
+                return
+            counts = Counter(tokenize(text))
+            length = sum(counts.values())
+            self._docs[doc_id] = (text, length)
+            self._total_length += length
+            for term, tf in counts.items():
+                self._postings[term][doc_id] = tf
+
+    def remove(self, doc_id):
+        with self._lock:
+            entry = self._docs.pop(doc_id, None)
+            if entry is None:
+                return
+            text, length = entry
+            self._total_length -= length
+            for term in set(tokenize(text)):
+                postings = self._postings.get(term)
+                if postings is not None:
+                    postings.pop(doc_id, None)
+                    if not postings:
+                        del self._postings[term]
+
+    def clear(self):
+        with self._lock:
+            self._docs.clear()
+            self._postings.clear()
+            self._total_length = 0
+
+    def search(self, terms, k=3):
+        """
+        Scores documents for the given (already tokenized) terms.
+        Returns up to k (doc_id, score) pairs, best first.
+        """
+        with self._lock:
+            n_docs = len(self._docs)
+            if not n_docs:
+                return []
+            avg_length = self._total_length / n_docs
+            scores = defaultdict(float)
+            for term in set(terms):
+                postings = self._postings.get(term)
+                if not postings:
+                    continue
+                idf = math.log(1 + (n_docs - len(postings) + 0.5) / (len(postings) + 0.5))
+                for doc_id, tf in postings.items():
+                    length = self._docs[doc_id][1]
+                    norm = tf + self.k1 * (1 - self.b + self.b * length / avg_length)
+                    scores[doc_id] += idf * tf * (self.k1 + 1) / norm
+        return sorted(scores.items(), key=lambda item: item[1], reverse=True)[:k]
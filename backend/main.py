@@ -1,16 +1,60 @@
-from fastapi import FastAPI, UploadFile, File, Form, HTTPException, Body
+from fastapi import FastAPI, UploadFile, File, Form, HTTPException, Body, Header, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import JSONResponse, Response, PlainTextResponse
+from fastapi.encoders import jsonable_encoder
+from fastapi.concurrency import run_in_threadpool
 from pydantic import BaseModel
 import pandas as pd
 import uvicorn
 import os
 import json
-from agent import agent_instance as agent
-from analyzer import auto_eda, generate_plots, clean_for_json, get_failure_stats, get_correlation_stats
-from reporting import get_failures, save_report, list_reports, get_report
+import time
+import threading
+from agent import agent_instance as agent, sessions
+from analyzer import auto_eda, generate_plots, clean_for_json, get_failure_stats, get_correlation_stats, load_plotting, analyze_failure_modes
+from reporting import get_failures, save_report, list_reports, get_report, reports_version, report_version
+from knowledge import get_kb, INGEST_STAGES
+from executor import executor_pool, shared_frames
+from analysis_pool import analysis_pool
+from scheduler import llm_scheduler, SchedulerBusy
+from jobs import job_manager, JobCancelled, ACTIVE_STATES
+from state import state, WEB_WORKERS
+from metrics import registry, HTTP_SECONDS, trace, breakdown
+from accounting import memory_guard, memory_tracer, deep_size, to_mb, UPLOAD_EXPANSION
+from context import ContextBuilder, correlation_lines, dedupe_excerpts, estimate_tokens, EXCERPT_MAX_CHARS, REPORT_TOKEN_BUDGET
 
 app = FastAPI()
 
+WARM_UP = os.getenv("WARM_UP", "1") != "0"
+
+def warm_up():
+    """
+    Loads the heavy, lazily imported pieces (knowledge base, plotting) off the
+    request path, so the API accepts requests immediately after import.
+    """
+    start = time.time()
+    try:
+        get_kb()
+        load_plotting()
+        print(f"Warm-up complete in {time.time() - start:.1f}s.")
+    except Exception as e:
+        print(f"Warm-up failed (will load on first use): {e}")
+
+@app.on_event("startup")
+def warm_executor_pool():
+    # Pre-start sandbox workers so the first /chat doesn't pay process startup
+    executor_pool.start()
+    if WARM_UP:
+        threading.Thread(target=warm_up, daemon=True).start()
+        # Model load runs alongside, so its cold start doesn't land on the first user
+        agent.warm_up_async()
+
+@app.on_event("shutdown")
+def stop_executor_pool():
+    analysis_pool.shutdown()
+    executor_pool.shutdown()
+
 # Add CORS middleware
 app.add_middleware(
     CORSMiddleware,
@@ -20,80 +64,306 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Analysis Cache: Stores pre-computed reports for instant access
-# Structure: { "why": "Report Text...", "fix": "Report Text..." }
-# Analysis Cache: Stores pre-computed reports for instant access
-# Structure: { "why": "Report Text...", "fix": "Report Text..." }
-ANALYSIS_CACHE = {}
+# Compress large JSON bodies (plots, EDA, failure lists)
+GZIP_MIN_BYTES = int(os.getenv("GZIP_MIN_BYTES", "1024"))
+app.add_middleware(GZipMiddleware, minimum_size=GZIP_MIN_BYTES)
 
-DATASTORE = {}
+def etag_response(request: Request, tag, build):
+    """
+    Conditional GET. `tag` identifies the body's version (dataset hash,
+    report version, params); an If-None-Match hit returns 304 without
+    building the body. With tag=None the body is built and hashed instead.
+    Error bodies, and bodies with an errored part (a snapshot field), are
+    sent without a validator, so clients retry them instead of revalidating.
+    """
+    body = None
+    if tag is None:
+        body = jsonable_encoder(build())
+        tag = hashlib.sha1(json.dumps(body, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+    etag = f'W/"{tag}"'
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+
+    client_tags = [t.strip().removeprefix("W/") for t in request.headers.get("if-none-match", "").split(",")]
+    if etag.removeprefix("W/") in client_tags or "*" in client_tags:
+        return Response(status_code=304, headers=headers)
+
+    if body is None:
+        body = jsonable_encoder(build())
+    if _has_error(body):
+        return JSONResponse(body)
+    return JSONResponse(body, headers=headers)
 
-# Store for user-defined acronyms
-DATASTORE["acronyms"] = {}
+def _has_error(body):
+    if not isinstance(body, dict):
+        return False
+    return "error" in body or any(isinstance(part, dict) and "error" in part for part in body.values())
 
+def dataset_tag(name: str, *params):
+    return "-".join([name, DATASTORE["version"][:16]] + [str(p) for p in params])
+
+# This process's view of the current dataset ("df", "machine_name", "version").
+# The shared state ("dataset:current") is authoritative: with several worker
+# processes, each one loads the dataset another worker received on upload.
+DATASTORE = {}
+
+import io
+import hashlib
 import threading
-from tools import search_web
+from cache import LRUCache, SingleFlight
+from definitions import resolve_definitions, definition_store
+
+# Parsed datasets and everything derived from them, keyed by content hash
+# (sha256 of the uploaded bytes), so re-uploading the same file restores
+# its frame, EDA, plots and statistics instead of recomputing.
+# Entry: {"df", "artifacts": {name: result}, "frame_bytes": deep size, once measured}
+# LLM reports live in the shared state instead: "analysis:{version}" holds
+# {type: report} and "analysis_acronyms:{version}" the acronyms the finished
+# report was built with.
+DATASET_CACHE_SIZE = int(os.getenv("DATASET_CACHE_SIZE", "4"))
+DATASETS = LRUCache(maxsize=DATASET_CACHE_SIZE)
 
+# Uploaded files, so every worker process can load the current dataset
+DATASET_DIR = os.getenv("DATASET_DIR", os.path.join(os.path.dirname(__file__), "datasets"))
+DATASET_FILES_KEEP = int(os.getenv("DATASET_FILES_KEEP", str(DATASET_CACHE_SIZE)))
+ANALYSIS_STATE_TTL = 7 * 24 * 3600
+ANALYSIS_LEASE_TTL = int(os.getenv("ANALYSIS_LEASE_TTL", "900"))
+MANUAL_LEASE_TTL = int(os.getenv("MANUAL_LEASE_TTL", "3600"))
 
+def current_dataset():
+    return DATASETS.get(DATASTORE.get("version"))
 
-def run_background_analysis(df, machine_name):
+def store_dataset_file(version: str, raw: bytes):
+    """
+    Writes the uploaded bytes to DATASET_DIR/{version}.csv (once per content
+    hash) and prunes all but the DATASET_FILES_KEEP most recent files.
+    """
+    os.makedirs(DATASET_DIR, exist_ok=True)
+    path = os.path.join(DATASET_DIR, f"{version}.csv")
+    if os.path.exists(path):
+        os.utime(path)
+    else:
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(raw)
+        os.replace(tmp, path)
+
+    files = sorted(
+        (os.path.join(DATASET_DIR, f) for f in os.listdir(DATASET_DIR) if f.endswith(".csv")),
+        key=os.path.getmtime, reverse=True
+    )
+    for old in files[DATASET_FILES_KEEP:]:
+        try:
+            os.remove(old)
+        except OSError:
+            pass
+    return path
+
+def load_dataset(version: str, source):
+    """
+    Returns the DATASETS entry for `version`, parsing `source` (bytes or a
+    path) only if this process hasn't already.
+    """
+    entry = DATASETS.get(version)
+    if entry is None:
+        df = pd.read_csv(io.BytesIO(source) if isinstance(source, bytes) else source)
+        # Basic sanitization: strip whitespace from headers
+        df.columns = df.columns.str.strip()
+        entry = {"df": df, "artifacts": {}}
+        DATASETS.put(version, entry)
+    return entry
+
+def activate_dataset(version: str, entry, machine_name):
+    DATASTORE["df"] = entry["df"]
+    DATASTORE["machine_name"] = machine_name # Store the context
+    DATASTORE["version"] = version
+    # Hand the new dataset to the sandbox workers once, up front
+    executor_pool.publish(entry["df"])
+
+SYNC_LOCK = threading.Lock()
+
+def sync_dataset():
+    """
+    Switches this process to the dataset in the shared state if another
+    worker process received a newer upload.
+    """
+    current = state.get("dataset:current")
+    if current is None or current["version"] == DATASTORE.get("version"):
+        return
+    with SYNC_LOCK:
+        if current["version"] == DATASTORE.get("version"):
+            return
+        try:
+            entry = load_dataset(current["version"], current["path"])
+        except OSError as e:
+            print(f"Could not load shared dataset {current['version'][:12]}: {e}")
+            return
+        activate_dataset(current["version"], entry, current.get("machine_name"))
+        print(f"Switched to dataset {current['version'][:12]} uploaded by another worker.")
+
+@app.middleware("http")
+async def sync_shared_state(request: Request, call_next):
+    await run_in_threadpool(sync_dataset)
+    return await call_next(request)
+
+@app.middleware("http")
+async def record_latency(request: Request, call_next):
+    start = time.perf_counter()
+    traced = memory_tracer.begin()
+    response = await call_next(request)
+    # Route template (e.g. /jobs/{job_id}), so ids don't each get a series
+    route = request.scope.get("route")
+    route = route.path if route else "unmatched"
+    HTTP_SECONDS.observe(time.perf_counter() - start, method=request.method,
+                         route=route, status=response.status_code)
+    memory_tracer.end(route, traced)
+    if memory_guard.high_water:
+        await run_in_threadpool(memory_guard.check)
+    return response
+
+def dataset_artifact(name: str, fn, entry=None):
+    """
+    Returns fn(df) for the current dataset, computed once per content hash.
+    Heavy analyzer functions run in the analysis process pool.
+    """
+    entry = entry or current_dataset()
+    if entry is None:
+        return analysis_pool.run(fn, DATASTORE["df"], name)
+    # The memory guard may evict artifacts at any time, so hold on to the result
+    result = entry["artifacts"].get(name)
+    if result is None:
+        result = entry["artifacts"][name] = analysis_pool.run(fn, entry["df"], name)
+    return result
+
+# Eviction under memory pressure, cheapest loss first: datasets other than
+# the current one, then (past the refusal mark only) the current dataset's
+# largest artifacts, plots first usually
+def evict_dataset():
+    for version, _ in DATASETS.items():
+        if version != DATASTORE.get("version"):
+            DATASETS.pop(version)
+            # Idle sessions may still reference the evicted frame
+            sessions.drop_frames(keep=DATASTORE.get("df"))
+            return version[:12]
+    return None
+
+def evict_artifact():
+    entry = current_dataset()
+    if entry is None or not entry["artifacts"]:
+        return None
+    artifacts = dict(entry["artifacts"])
+    name = max(artifacts, key=lambda n: deep_size(artifacts[n]))
+    entry["artifacts"].pop(name, None)
+    return name
+
+memory_guard.register("dataset", evict_dataset)
+memory_guard.register("artifact", evict_artifact, current=True)
+
+# Concurrent identical requests (dashboard tabs, re-renders) share one computation
+flights = SingleFlight()
+
+def coalesced(endpoint: str, fn, params=()):
+    return flights.do((endpoint, DATASTORE.get("version"), params), fn)
+
+def current_acronyms():
+    # User-defined acronyms; the definition store is shared by all worker processes
+    return definition_store.acronyms()
+
+def analysis_reports(version: str):
+    return state.get(f"analysis:{version}") if version else None
+
+def report_is_cached(version: str):
+    # A finished report stays valid until the acronyms it was built with change
+    return version is not None and state.get(f"analysis_acronyms:{version}") == current_acronyms()
+
+# Session ID used by the background analysis when queueing LLM work
+ANALYSIS_SESSION = "__analysis__"
+
+
+ANALYSIS_STAGES = ["statistics", "definitions", "retrieval", "generation"]
+
+# Guards analysis cache writes so a superseded job can't overwrite a newer one
+CACHE_LOCK = threading.Lock()
+
+def update_analysis_cache(job, values: dict, acronyms: dict = None):
+    # Each job writes to its own dataset's reports (job.key is the content hash)
+    with CACHE_LOCK:
+        job.check_cancelled()
+        if values:
+            state.update(f"analysis:{job.key}", values, ttl=ANALYSIS_STATE_TTL)
+        if acronyms is not None:
+            state.set(f"analysis_acronyms:{job.key}", acronyms, ttl=ANALYSIS_STATE_TTL)
+
+ANALYSIS_CANCELLED = "Analysis Cancelled"
+
+def mark_analysis_cancelled(job):
+    # Replace placeholders so readers stop waiting; no other job for this
+    # version can be writing, as this one still holds the analysis lease
+    with CACHE_LOCK:
+        reports = state.get(f"analysis:{job.key}") or {}
+        pending = {k: ANALYSIS_CANCELLED for k, v in reports.items() if v == "Analyzing..."}
+        if pending:
+            state.update(f"analysis:{job.key}", pending, ttl=ANALYSIS_STATE_TTL)
+
+def run_background_analysis(job, df, machine_name):
     """
     Runs key analyses in the background so they are ready when requested.
+    Executed as a JobManager job; stops at the next stage once cancelled.
     """
     print("Background Analysis Started...")
+    acronyms = current_acronyms()
+    entry = DATASETS.get(job.key)
     
     # Initialize placeholders
-    ANALYSIS_CACHE['why'] = "Analyzing..."
-    ANALYSIS_CACHE['impact'] = "Analyzing..."
-    ANALYSIS_CACHE['fix'] = "Analyzing..."
+    update_analysis_cache(job, {'why': "Analyzing...", 'impact': "Analyzing...", 'fix': "Analyzing..."})
     
     # 1. Root Cause (Why)
     print("Pre-computing Root Cause...")
     try:
-        agent.set_df(df, context_data={"machine_name": machine_name})
+        analysis_agent = sessions.get(ANALYSIS_SESSION)
+        analysis_agent.set_df(df, context_data={"machine_name": machine_name})
         
         # Build Statistical Context
-        f_stats = get_failure_stats(df)
-        c_stats = get_correlation_stats(df)
+        with job.stage("statistics"):
+            f_stats = dataset_artifact("failure_stats", get_failure_stats, entry)
+            c_stats = dataset_artifact("correlation_stats", get_correlation_stats, entry)
         
         if "error" in f_stats:
-            ANALYSIS_CACHE['why'] = f"Analysis Skipped: {f_stats['error']}"
+            update_analysis_cache(job, {'why': f"Analysis Skipped: {f_stats['error']}"})
         elif f_stats["total_failures"] == 0:
-            ANALYSIS_CACHE['why'] = "No failures detected. Root cause analysis not required."
+            update_analysis_cache(job, {'why': "No failures detected. Root cause analysis not required."})
         else:
+            # Context sections in priority order; the builder trims to the token budget
+            context = ContextBuilder(budget=REPORT_TOKEN_BUDGET)
+            context.add("Failure mode breakdown:",
+                        [f"- {m['name']}: {m['count']} ({m['percent']:.1f}%)" for m in f_stats["modes"]], priority=0)
+
             # Build Knowledge Context (Definitions ONLY)
-            knowledge_context = ""
-            if f_stats["modes"]:
-                knowledge_context += "\nSemantic Definitions:\n"
-                for mode in f_stats["modes"]:
-                    name = mode['name']
-                    definition = None
-                    source = None
-                    
-                    # 1. Manuals
-                    rag_hits = kb.search_manuals(f"What does failure mode {name} mean?", k=1)
-                    if rag_hits:
-                        definition = rag_hits[0]
-                        source = "Manuals"
-                    
-                    # 2. User Acronyms
-                    if not definition and name in DATASTORE.get("acronyms", {}):
-                        definition = DATASTORE["acronyms"][name]
-                        source = "User Definition"
-                        
-                    # 3. Web Search
-                    if not definition:
-                        try:
-                            web_res = search_web(f"meaning of {name} failure mode reliability engineering")
-                            if web_res:
-                                definition = web_res[:200]
-                                source = "Web Search"
-                        except: pass
-                            
-                    if definition:
-                        knowledge_context += f"- **{name}**: {definition} [Source: {source}]\n"
-                    else:
-                        knowledge_context += f"- **{name}**: No semantic definition available.\n"
+            manual_definitions = []
+            with job.stage("definitions"):
+                if f_stats["modes"]:
+                    # Manuals -> User Acronyms -> Web Search, resolved concurrently across modes
+                    resolved = resolve_definitions(
+                        [mode['name'] for mode in f_stats["modes"]], acronyms
+                    )
+                    definitions = []
+                    for mode in f_stats["modes"]:
+                        name = mode['name']
+                        definition, source = resolved[name]
+                        if source == "Manuals":
+                            manual_definitions.append(definition)
+                        if definition:
+                            definitions.append(f"- **{name}**: {' '.join(definition.split())[:EXCERPT_MAX_CHARS]} [Source: {source}]")
+                        else:
+                            definitions.append(f"- **{name}**: No semantic definition available.")
+                    context.add("Semantic Definitions:", definitions, priority=1)
+
+            context.add("Correlation insights:", correlation_lines(c_stats), priority=2)
+
+            # RAG for repair (Global search)
+            with job.stage("retrieval"):
+                hits = get_kb().search_manuals("Repair procedures for detected failures", k=3)
+                # Definitions above may already quote the same manual passages
+                context.add("MANUAL EXCERPTS:", dedupe_excerpts(hits, seen=manual_definitions), priority=3)
 
             # Construct Combined Prompt (Data + Knowledge)
             prompt_failure = f"""
@@ -103,44 +373,98 @@ DATA CONTEXT:
 Dataset summary:
 - Total records: {f_stats['total_records']}
 - Total failures: {f_stats['total_failures']}
-
-Failure mode breakdown:
 """
-            for m in f_stats["modes"]:
-                prompt_failure += f"- {m['name']}: {m['count']} ({m['percent']:.1f}%)\n"
-
-            prompt_failure += "\nStatistical observations:\n"
             if f_stats["modes"]:
                 prompt_failure += f"- Most frequent: {f_stats['modes'][0]['name']}\n"
-            
-            prompt_failure += "\nCorrelation insights:\n"
-            if "top_correlations" in c_stats and c_stats["top_correlations"]:
-                for item in c_stats["top_correlations"]:
-                    prompt_failure += f"  {item['feature']}: {item['value']:.2f}\n"
-
-            prompt_failure += knowledge_context
-
-            # RAG for repair (Global search)
-            hits = kb.search_manuals("Repair procedures for detected failures", k=3)
-            if hits:
-                prompt_failure += "\nMANUAL EXCERPTS:\n" + "\n".join(hits)
+            prompt_failure += "\n" + context.build()
 
-            # SINGLE CALL
-            full_report = agent.generate_direct(prompt_failure, system_type="failure")
+            # SINGLE CALL (background work waits its turn instead of being refused)
+            with job.stage("generation") as stage:
+                stage["prompt_tokens"] = estimate_tokens(prompt_failure)
+                stage["context"] = context.stats
+                full_report = analysis_agent.generate_direct(prompt_failure, system_type="failure", reject=False)
             
             # Store in cache (all keys point to valid report to support legacy endpoints)
-            ANALYSIS_CACHE['combined'] = full_report
-            ANALYSIS_CACHE['why'] = full_report
-            ANALYSIS_CACHE['impact'] = full_report
-            ANALYSIS_CACHE['fix'] = full_report
+            update_analysis_cache(job, {
+                'combined': full_report,
+                'why': full_report,
+                'impact': full_report,
+                'fix': full_report
+            })
             
         print("Failure Analysis Computed (Combined).")
+        update_analysis_cache(job, {}, acronyms=acronyms)
+    except JobCancelled:
+        print(f"Background Analysis {job.id} cancelled.")
+        raise
     except Exception as e:
         print(f"Error computing Failure Analysis: {e}")
-        ANALYSIS_CACHE['combined'] = f"Analysis Failed: {str(e)}"
+        update_analysis_cache(job, {'combined': f"Analysis Failed: {str(e)}"})
+        raise
     
     print("Background Analysis Complete! Cache populated.")
 
+def run_analysis_job(job, df, machine_name):
+    # Holds the analysis lease for job.key, taken by start_analysis_job
+    try:
+        with trace() as spans, sessions.use(ANALYSIS_SESSION):
+            run_background_analysis(job, df, machine_name)
+    except JobCancelled:
+        mark_analysis_cancelled(job)
+        raise
+    finally:
+        # Where the time went: statistics, web search, RAG, LLM queue and generation
+        state.set(f"analysis_timings:{job.key}", breakdown(spans), ttl=ANALYSIS_STATE_TTL)
+
+def analysis_job(version: str):
+    """
+    Status dict of the latest analysis job for `version`, from any worker.
+    """
+    job_id = state.get(f"analysis_job:{version}") if version else None
+    return job_manager.describe(job_id) if job_id else None
+
+def start_analysis_job(force: bool = False):
+    """
+    Queues the background analysis for the current dataset version.
+    Re-requests for the same version join the running job (in this or
+    another worker process); a new version cancels older runs.
+    Returns (status, job_id): ("ready", None) when the dataset already has
+    a finished report (unless forced), else ("started", id). The id is None
+    while another worker has just taken the job and not yet published it.
+    """
+    version = DATASTORE["version"]
+    if not force and report_is_cached(version):
+        return "ready", None
+    # One analysis per dataset across all worker processes. Whoever holds
+    # the lease owns analysis_job:{version}; everyone else joins its job.
+    # Checked before the job snapshot, which a dead process may have left "running".
+    lease_key = f"analysis:{version}"
+    lease = state.acquire(lease_key, 1, ttl=ANALYSIS_LEASE_TTL)
+    if lease is None:
+        running = analysis_job(version)
+        if running and running["status"] in ("queued", "running"):
+            return "started", running["id"]
+        print(f"Background Analysis for {version[:12]} is being started by another worker.")
+        return "started", None
+
+    def release(job):
+        state.release(lease_key, lease)
+
+    job = job_manager.submit(
+        "analysis", version, run_analysis_job,
+        DATASTORE["df"], DATASTORE.get("machine_name"),
+        stages=ANALYSIS_STAGES,
+        # Superseded by an upload to any worker process
+        cancel_check=lambda: (state.get("dataset:current") or {}).get("version") != version,
+        on_finish=release
+    )
+    if job.on_finish is not release:
+        # Joined a job this process already runs, which has its own lease
+        state.release(lease_key, lease)
+        return "started", job.id
+    state.set(f"analysis_job:{version}", job.id, ttl=ANALYSIS_STATE_TTL)
+    return "started", job.id
+
 class Query(BaseModel):
     question: str
 
@@ -149,8 +473,8 @@ class AcronymPayload(BaseModel):
 
 @app.post("/settings/acronyms")
 def update_acronyms(payload: AcronymPayload):
-    DATASTORE["acronyms"].update(payload.acronyms)
-    return {"message": "Acronyms updated", "total": len(DATASTORE["acronyms"])}
+    definition_store.set_acronyms(payload.acronyms)
+    return {"message": "Acronyms updated", "total": len(current_acronyms())}
 
 @app.get("/settings/acronyms/unknown")
 def get_unknown_acronyms():
@@ -158,12 +482,12 @@ def get_unknown_acronyms():
     if df is None:
         return {"error": "No dataset loaded"}
         
-    stats = get_failure_stats(df)
+    stats = dataset_artifact("failure_stats", get_failure_stats)
     if "error" in stats:
         return {"unknown": []}
         
     unknown = []
-    known = DATASTORE.get("acronyms", {})
+    known = current_acronyms()
     
     for m in stats.get("modes", []):
         name = m["name"]
@@ -179,40 +503,55 @@ from typing import Optional
 @app.post("/upload")
 def upload_csv(file: UploadFile = File(...), machine_name: Optional[str] = Form(None)):
     try:
-        df = pd.read_csv(file.file)
-        # Basic sanitization: strip whitespace from headers
-        df.columns = df.columns.str.strip()
-        DATASTORE["df"] = df
-        DATASTORE["machine_name"] = machine_name # Store the context
-        
-        # Clear old cache
-        ANALYSIS_CACHE.clear()
+        raw = file.file.read()
+        # Identifies this dataset for artifact reuse and job dedup
+        version = hashlib.sha256(raw).hexdigest()
+
+        reused = DATASETS.get(version) is not None or analysis_reports(version) is not None
+        if version not in DATASETS:
+            # Refuse before parsing rather than being OOM-killed while parsing
+            fits, msg = memory_guard.admit(int(len(raw) * UPLOAD_EXPANSION))
+            if not fits:
+                raise HTTPException(status_code=503, detail=msg)
+        entry = load_dataset(version, raw)
+        df = entry["df"]
+
+        with SYNC_LOCK:
+            activate_dataset(version, entry, machine_name)
+            # Other worker processes pick the dataset up on their next request
+            path = store_dataset_file(version, raw)
+            state.set("dataset:current", {"version": version, "machine_name": machine_name, "path": path})
         
         # Calculate true failures
-        stats = get_failure_stats(df)
+        stats = dataset_artifact("failure_stats", get_failure_stats, entry)
         if "error" in stats:
              failure_count = df.shape[0] if stats["error"] == "No target column found" else 0
              unknown = []
         else:
              failure_count = stats["total_failures"]
              # Identify unknown acronyms
-             known = DATASTORE.get("acronyms", {})
+             known = current_acronyms()
              unknown = []
              for m in stats.get("modes", []):
                  if m["name"] not in known:
                      unknown.append(m["name"])
 
         # Create status
+        job_id = None
         if unknown:
             status = "waiting_for_definitions"
             message = "Dataset uploaded. Please define failure modes."
+            # Anything still running belongs to the previous dataset
+            for job in job_manager.list("analysis"):
+                job.cancel()
+        elif report_is_cached(version):
+            status = "analysis_ready"
+            message = "Dataset already analyzed. Restored cached results."
         else:
             status = "analysis_started"
             message = "Dataset uploaded. Analysis starting..."
-            # Start Background Analysis Thread immediately if everything is known
-            thread = threading.Thread(target=run_background_analysis, args=(df, machine_name))
-            thread.daemon = True
-            thread.start()
+            # Start Background Analysis immediately if everything is known
+            _, job_id = start_analysis_job()
 
         return {
             "message": message,
@@ -221,99 +560,163 @@ def upload_csv(file: UploadFile = File(...), machine_name: Optional[str] = Form(
             "failure_count": failure_count,
             "columns": df.shape[1],
             "unknown_acronyms": unknown,
-            "status": status
+            "status": status,
+            "job_id": job_id,
+            "version": version,
+            "reused": reused
         }
+    except HTTPException:
+        raise
     except Exception as e:
         return {"error": f"Failed to parse CSV: {str(e)}"}
 
 @app.post("/analysis/start")
-def start_analysis():
+def start_analysis(force: bool = False):
     df = DATASTORE.get("df")
-    machine_name = DATASTORE.get("machine_name")
     
     if df is None:
         raise HTTPException(status_code=400, detail="No dataset loaded")
         
-    # Check if already running? (Optional optimization)
-    # We just restart/overwrite the thread. Python threads can't be killed easily, 
-    # but run_background_analysis checks cache keys so it might overlap.
-    # However, for this single-user local app, it's fine.
+    # Repeated clicks join the job already running for this dataset
+    status, job_id = start_analysis_job(force=force)
+    if status == "ready":
+        return {"message": "Analysis restored from cache", "status": "ready", "job_id": None}
     
-    thread = threading.Thread(target=run_background_analysis, args=(df, machine_name))
-    thread.daemon = True
-    thread.start()
-    
-    return {"message": "Analysis started", "status": "started"}
+    return {"message": "Analysis started", "status": "started", "job_id": job_id}
+
+# --- Background Jobs API ---
+
+@app.get("/jobs")
+def get_jobs(kind: Optional[str] = None):
+    return [job.to_dict() for job in job_manager.list(kind)]
+
+@app.get("/jobs/{job_id}")
+def get_job(job_id: str):
+    # Also finds jobs running in other worker processes
+    job = job_manager.describe(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+@app.post("/jobs/{job_id}/cancel")
+def cancel_job(job_id: str):
+    job = job_manager.describe(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    if job["status"] not in ACTIVE_STATES:
+        raise HTTPException(status_code=409, detail=f"Job already {job['status']}")
+    job_manager.cancel(job_id)
+    return {"message": "Cancellation requested", "id": job_id}
 
 
 
 from analyzer import auto_eda, generate_plots, clean_for_json
 
 @app.get("/eda")
-def get_eda():
+def get_eda(request: Request):
     df = DATASTORE.get("df")
     if df is None:
         return {"error": "No dataset has been uploaded"}
-    return auto_eda(df)
+    return etag_response(request, dataset_tag("eda"), build_eda)
+
+def build_failure_stats():
+    return dataset_artifact("failure_stats", get_failure_stats)
+
+def build_fast_failure():
+    # Reuses the failure statistics shared with upload, analysis and snapshot
+    return coalesced("fast_failure", lambda: dataset_artifact(
+        "fast_failure", lambda df: analyze_failure_modes(df, build_failure_stats())
+    ))
+
+def build_eda():
+    return coalesced("eda", lambda: dataset_artifact("eda", auto_eda))
+
+def build_plots():
+    try:
+        return coalesced("eda_plots", lambda: dataset_artifact("plots", generate_plots))
+    except Exception as e:
+        return {"error": str(e)}
 
 @app.get("/eda_plots")
-def get_eda_plots():
+def get_eda_plots(request: Request):
     df = DATASTORE.get("df")
     if df is None:
         return {"error": "No dataset has been uploaded"}
-    try:
-        plots = generate_plots(df)
-        return plots
-    except Exception as e:
-        return {"error": str(e)}
+    return etag_response(request, dataset_tag("eda_plots"), build_plots)
 
 @app.get("/data")
-def get_data(page: int = 1, limit: int = 50):
+def get_data(request: Request, page: int = 1, limit: int = 50):
     df = DATASTORE.get("df")
     if df is None:
         return {"error": "No dataset has been uploaded"}
     
-    start = (page - 1) * limit
-    end = start + limit
-    
-    # Slice and clean
-    subset = df.iloc[start:end]
-    data = subset.to_dict(orient="records")
-    return {
-        "page": page,
-        "limit": limit,
-        "total_rows": len(df),
-        "data": clean_for_json(data)
-    }
+    def build():
+        start = (page - 1) * limit
+        end = start + limit
+        
+        # Slice and clean
+        subset = df.iloc[start:end]
+        data = subset.to_dict(orient="records")
+        return {
+            "page": page,
+            "limit": limit,
+            "total_rows": len(df),
+            "data": clean_for_json(data)
+        }
+    return etag_response(request, dataset_tag("data", page, limit), build)
 
 import time
 from fastapi import HTTPException
 
 import os
 import shutil
-from knowledge import kb
 
-LAST_CHAT_TIME = 0
+def run_manual_ingest(job, file_path: str):
+    success, message = get_kb().ingest_manual(file_path, job=job)
+    if not success:
+        raise RuntimeError(message)
+    
+    # Cached manual definitions (and misses) predate this manual
+    definition_store.invalidate("Manuals")
+    return message
 
 @app.post("/manuals/upload")
-async def upload_manual(file: UploadFile = File(...)):
+def upload_manual(file: UploadFile = File(...)):
     try:
         if not file.filename.endswith(".pdf"):
             return {"error": "Only PDF files are supported."}
             
-        file_path = os.path.join("backend", "manuals", file.filename)
+        manuals_dir = os.path.join("backend", "manuals")
+        os.makedirs(manuals_dir, exist_ok=True)
+        file_path = os.path.join(manuals_dir, file.filename)
         
-        # Save file to disk
-        with open(file_path, "wb") as buffer:
+        # Save to a temp file; the manual itself may still be being parsed
+        tmp_path = f"{file_path}.{os.getpid()}.{threading.get_ident()}.upload"
+        with open(tmp_path, "wb") as buffer:
             shutil.copyfileobj(file.file, buffer)
-            
-        # Ingest into Knowledge Base (RAG)
-        success, message = kb.ingest_manual(file_path)
+
+        # One ingest per file across all worker processes, held until the job ends
+        lease_key = f"manual:{file_path}"
+        lease = state.acquire(lease_key, 1, ttl=MANUAL_LEASE_TTL)
+        if lease is None:
+            os.remove(tmp_path)
+            return JSONResponse(status_code=409, content={
+                "error": f"{file.filename} is still being indexed. Upload it again once that finishes."
+            })
+        os.replace(tmp_path, file_path)
+
+        def release(job):
+            state.release(lease_key, lease)
+
+        # Ingest into Knowledge Base (RAG) in the background
+        job = job_manager.submit(
+            "manual", file_path, run_manual_ingest, file_path,
+            stages=INGEST_STAGES, supersede=False, on_finish=release
+        )
+        if job.on_finish is not release:
+            state.release(lease_key, lease)
         
-        if success:
-            return {"message": f"Manual uploaded and indexed: {message}"}
-        else:
-            return {"error": f"Upload successful but indexing failed: {message}"}
+        return {"message": f"Manual uploaded, indexing started: {file.filename}", "job_id": job.id}
             
     except Exception as e:
         return {"error": f"Upload failed: {str(e)}"}
@@ -328,76 +731,157 @@ def list_manuals():
     except Exception as e:
         return {"error": str(e)}
 
-@app.post("/chat")
-def chat(query: Query):
-    global LAST_CHAT_TIME
-    current_time = time.time()
-    
-    # 5-second rate limit
-    if current_time - LAST_CHAT_TIME < 5:
+def get_session_id(request: Request, x_session_id: Optional[str]):
+    # Clients send X-Session-ID; fall back to the caller's address
+    if x_session_id:
+        return x_session_id
+    return request.client.host if request.client else "default"
+
+def run_in_session(session_id: str, question: str):
+    """
+    Runs the agent loop for one session; its LLM calls go through the LLM scheduler.
+    Raises HTTP 429 with queue position and ETA when the scheduler is saturated.
+    """
+    try:
+        with sessions.use(session_id) as session_agent:
+            session_agent.set_df(DATASTORE["df"], context_data={"machine_name": DATASTORE.get("machine_name")})
+            return session_agent.run(question)
+    except SchedulerBusy as e:
         raise HTTPException(
-            status_code=429, 
-            detail="Rate limit exceeded. Please wait 5 seconds."
+            status_code=429,
+            detail={
+                "message": f"{e.reason}. Please retry shortly.",
+                "queue_position": e.position,
+                "eta_seconds": round(e.eta, 1)
+            },
+            headers={"Retry-After": str(max(1, int(e.eta)))}
         )
-    
-    LAST_CHAT_TIME = current_time
 
+@app.post("/chat")
+def chat(query: Query, request: Request, x_session_id: Optional[str] = Header(None)):
     df = DATASTORE.get("df")
     if df is None:
         return {"error": "No dataset has been uploaded"}
     
-    # Update Agent Environment
-    agent.set_df(df, context_data={"machine_name": DATASTORE.get("machine_name")})
-    
     # Run Agent Loop
-    answer = agent.run(query.question)
-    return {"answer": answer}
+    with trace() as spans:
+        answer = run_in_session(get_session_id(request, x_session_id), query.question)
+    return {"answer": answer, "timings": breakdown(spans)}
+
+@app.get("/chat/memory")
+def chat_memory(request: Request, x_session_id: Optional[str] = Header(None)):
+    memory = sessions.get(get_session_id(request, x_session_id)).memory
+    return {"stats": memory.stats(), "context": memory.context_lines()}
+
+@app.post("/chat/memory/clear")
+def clear_chat_memory(request: Request, x_session_id: Optional[str] = Header(None)):
+    sessions.get(get_session_id(request, x_session_id)).memory.clear()
+    return {"message": "Conversation memory cleared"}
 
 @app.get("/auto_analysis")
-def auto_analysis():
-    # ... restored previously ...
+def auto_analysis(request: Request, x_session_id: Optional[str] = Header(None)):
     df = DATASTORE.get("df")
-    agent.set_df(df, context_data={"machine_name": DATASTORE.get("machine_name")})
+    if df is None:
+        return {"error": "No dataset has been uploaded"}
     prompt = "Perform a comprehensive reliability analysis..."
-    report = agent.run(prompt)
-    return {"report": report}
+    with trace() as spans:
+        report = run_in_session(get_session_id(request, x_session_id), prompt)
+    return {"report": report, "timings": breakdown(spans)}
 
 @app.get("/analysis/fast_failure")
-def fast_failure_analysis():
+def fast_failure_analysis(request: Request):
     df = DATASTORE.get("df")
     if df is None:
         return {"error": "No data loaded"}
     
-    from analyzer import analyze_failure_modes
-    report = analyze_failure_modes(df)
-    return {"answer": report}
+    return etag_response(request, dataset_tag("fast_failure"), lambda: {"answer": build_fast_failure()})
 
 @app.get("/analysis/report")
-def get_cached_report(type: str = "why"):
+def get_cached_report(request: Request, type: str = "why"):
     """
     Returns the pre-computed analysis from the cache.
     Types: 'why' (Root Cause), 'impact' (Impact), 'fix' (Repair)
     """
-    if type in ANALYSIS_CACHE:
-        answer = ANALYSIS_CACHE[type]
+    # Status and progress change while the job runs, so the ETag is a content hash
+    return etag_response(request, None, lambda: report_status(type))
+
+def report_status(type: str):
+    reports = analysis_reports(DATASTORE.get("version")) or {}
+    if type in reports:
+        answer = reports[type]
         if answer == "Analyzing...":
-             return {"answer": "Background analysis in progress. Please wait...", "status": "pending"}
+             job = analysis_job(DATASTORE.get("version"))
+             return {
+                 "answer": "Background analysis in progress. Please wait...",
+                 "status": "pending",
+                 "progress": job["progress"] if job else None
+             }
         elif "Analysis Failed" in answer:
              return {"answer": answer, "status": "error"}
+        elif answer == ANALYSIS_CANCELLED:
+             return {"answer": "Analysis was cancelled. Start it again to generate the report.", "status": "cancelled"}
         else:
-             return {"answer": answer, "status": "ready"}
+             timings = state.get(f"analysis_timings:{DATASTORE.get('version')}")
+             return {"answer": answer, "status": "ready", "timings": timings}
     else:
         # Cache missing entirely - means upload never happened or server restarted
         return {"answer": "No analysis data found. Please re-upload CSV.", "status": "error"}
 
+# --- Dashboard Snapshot ---
+
+def analysis_status():
+    job = analysis_job(DATASTORE.get("version"))
+    status = report_status("why")
+    status["job_id"] = job["id"] if job else None
+    return status
+
+SNAPSHOT_FIELDS = {
+    "eda": build_eda,
+    "plots": build_plots,
+    "failure_stats": build_failure_stats,
+    "fast_failure": build_fast_failure,
+    "analysis": analysis_status,
+}
+
+@app.get("/dashboard/snapshot")
+def dashboard_snapshot(request: Request, fields: Optional[str] = None):
+    """
+    Everything the dashboard renders in one response, built from the same
+    per-dataset artifacts as the individual endpoints.
+    `fields` is a comma-separated mask (default: all of SNAPSHOT_FIELDS).
+    """
+    df = DATASTORE.get("df")
+    if df is None:
+        return {"error": "No dataset has been uploaded"}
+
+    requested = [f.strip() for f in fields.split(",") if f.strip()] if fields else list(SNAPSHOT_FIELDS)
+    unknown = [f for f in requested if f not in SNAPSHOT_FIELDS]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(unknown)}. Choose from: {', '.join(SNAPSHOT_FIELDS)}")
+
+    # Everything but the analysis status is fixed per dataset version
+    tag = dataset_tag("snapshot", *sorted(requested))
+    analysis = None
+    if "analysis" in requested:
+        analysis = analysis_status()
+        tag += "-" + hashlib.sha1(json.dumps(analysis, sort_keys=True, default=str).encode("utf-8")).hexdigest()[:12]
+
+    def build():
+        snapshot = {"version": DATASTORE["version"]}
+        for field in requested:
+            snapshot[field] = analysis if field == "analysis" else SNAPSHOT_FIELDS[field]()
+        return snapshot
+    return etag_response(request, tag, build)
+
 @app.get("/failures")
-def get_failure_list():
+def get_failure_list(request: Request):
     df = DATASTORE.get("df")
     if df is None:
         return {"error": "No data loaded"}
     
-    failures = get_failures(df)
-    return {"failures": failures}
+    return etag_response(request, dataset_tag("failures"), lambda: {
+        "failures": coalesced("failures", lambda: dataset_artifact("failures", get_failures))
+    })
 
 @app.post("/reports/save")
 def save_current_report(analysis_type: str = Body(..., embed=True)):
@@ -411,22 +895,88 @@ def save_current_report(analysis_type: str = Body(..., embed=True)):
     return {"id": report_id, "message": msg}
 
 @app.get("/reports")
-def get_all_reports():
-    return list_reports()
+def get_all_reports(request: Request):
+    return etag_response(request, f"reports-{reports_version()}", list_reports)
 
 @app.get("/reports/{report_id}")
-def get_single_report(report_id: str):
-    data = get_report(report_id)
-    if data:
-        return data
-    raise HTTPException(status_code=404, detail="Report not found")
+def get_single_report(report_id: str, request: Request):
+    def build():
+        data = get_report(report_id)
+        if data:
+            return data
+        raise HTTPException(status_code=404, detail="Report not found")
+
+    version = report_version(report_id)
+    if version is None:
+        raise HTTPException(status_code=404, detail="Report not found")
+    # Saved reports never change, so a matching ETag skips reading the file
+    return etag_response(request, version, build)
+
+# --- Memory Accounting ---
+
+def frame_bytes(entry):
+    # Frames never change once parsed, so measure each once
+    if "frame_bytes" not in entry:
+        entry["frame_bytes"] = deep_size(entry["df"])
+    return entry["frame_bytes"]
+
+@app.get("/system/memory")
+def system_memory(top: int = 0):
+    """
+    Process RSS against the configured marks, and the deep size of every
+    dataset, artifact cache and per-session memory this process holds.
+    `top` adds the largest tracemalloc allocation sites (MEMORY_TRACE=1).
+    """
+    current = DATASTORE.get("version")
+    datasets = []
+    total = 0
+    for version, entry in reversed(DATASETS.items()):
+        artifacts = {name: deep_size(value) for name, value in dict(entry["artifacts"]).items()}
+        total += frame_bytes(entry) + sum(artifacts.values())
+        datasets.append({
+            "version": version[:12],
+            "current": version == current,
+            "rows": entry["df"].shape[0],
+            "columns": entry["df"].shape[1],
+            "frame_mb": to_mb(frame_bytes(entry)),
+            "artifacts_mb": {name: to_mb(size) for name, size in artifacts.items()},
+        })
+
+    report = memory_guard.stats()
+    state_bytes = state.nbytes()
+    report.update({
+        "datasets": datasets,
+        "datasets_mb": to_mb(total),
+        "shared_frame_mb": to_mb(shared_frames.nbytes()),
+        "analysis_state_mb": to_mb(state_bytes) if state_bytes is not None else None,
+        "sessions": sessions.memory_stats(),
+        "tracemalloc": memory_tracer.stats(top),
+    })
+    return report
+
+# --- Metrics ---
+
+@app.get("/metrics")
+def get_metrics():
+    """
+    Prometheus text exposition of this worker process's latency histograms.
+    """
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
 
 # --- Settings API ---
 
 @app.get("/settings/config")
 def get_settings_config():
     conf = agent.get_config()
+    kb = get_kb()
     conf["rag_depth"] = kb.n_results
+    conf["embedding_backend"] = kb.embeddings.name
+    conf["llm_scheduler"] = llm_scheduler.stats()
+    conf["active_sessions"] = len(sessions)
+    conf["single_flight"] = flights.stats()
+    conf["analysis_pool"] = analysis_pool.stats()
+    conf["state_backend"] = state.name
+    conf["web_workers"] = WEB_WORKERS
     return conf
 
 @app.get("/settings/models")
@@ -439,7 +989,7 @@ class ModelUpdate(BaseModel):
 @app.post("/settings/model")
 def update_settings_model(update: ModelUpdate):
     msg = agent.set_model(update.model)
-    return {"message": msg, "current_model": agent.model}
+    return {"message": msg, "current_model": agent.ollama_model, "model_state": agent.get_model_state()}
 
 class TempUpdate(BaseModel):
     temperature: float
@@ -451,8 +1001,9 @@ def update_settings_temp(update: TempUpdate):
 
 @app.post("/manuals/clear")
 def clear_manuals_kb():
-    success, msg = kb.clear_index()
+    success, msg = get_kb().clear_index()
     if success:
+        definition_store.invalidate("Manuals")
         return {"message": msg}
     else:
         raise HTTPException(status_code=500, detail=msg)
@@ -471,8 +1022,15 @@ class RagUpdate(BaseModel):
 
 @app.post("/settings/rag")
 def update_rag_settings(update: RagUpdate):
+    kb = get_kb()
     msg = kb.set_depth(update.n_results)
     return {"message": msg, "depth": kb.n_results}
 
 if __name__ == "__main__":
-    uvicorn.run(app, host="0.0.0.0", port=8000)
+    if WEB_WORKERS > 1:
+        if state.name == "memory":
+            raise SystemExit("STATE_BACKEND=memory isn't shared between worker processes; use sqlite.")
+        # Each worker process imports main; shared state goes through `state`
+        uvicorn.run("main:app", host="0.0.0.0", port=8000, workers=WEB_WORKERS)
+    else:
+        uvicorn.run(app, host="0.0.0.0", port=8000)
@@ -0,0 +1,155 @@
+import time
+import threading
+import contextvars
+from functools import wraps
+from contextlib import contextmanager
+
+# --- LATENCY METRICS ---
+# Histogram bucket upper bounds in seconds: sub-ms pandas work up to slow LLM generations
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def _labels(pairs):
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}" if pairs else ""
+
+
+class Histogram:
+    """
+    Cumulative latency histogram with a fixed label set, exported in the
+    Prometheus text format (_bucket, _sum, _count per label combination).
+    """
+
+    def __init__(self, name: str, help: str, labels=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.buckets = tuple(sorted(buckets))
+        self._series = {}  # label values -> [bucket counts..., sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = tuple(str(labels.get(name, "")) for name in self.labels)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0] * len(self.buckets) + [0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = sorted((key, list(values)) for key, values in self._series.items())
+        for key, values in series:
+            pairs = list(zip(self.labels, key))
+            for bound, count in zip(self.buckets, values):
+                lines.append(f"{self.name}_bucket{_labels(pairs + [('le', bound)])} {count}")
+            lines.append(f"{self.name}_bucket{_labels(pairs + [('le', '+Inf')])} {values[-1]}")
+            lines.append(f"{self.name}_sum{_labels(pairs)} {values[-2]:.6f}")
+            lines.append(f"{self.name}_count{_labels(pairs)} {values[-1]}")
+        return lines
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def histogram(self, name: str, help: str, labels=(), buckets=LATENCY_BUCKETS) -> Histogram:
+        with self._lock:
+            if name not in self._metrics:
+                self._metrics[name] = Histogram(name, help, labels, buckets)
+            return self._metrics[name]
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return "\n".join(line for metric in metrics for line in metric.render()) + "\n"
+
+
+# Singleton instance (per process)
+registry = MetricsRegistry()
+
+STAGE_SECONDS = registry.histogram(
+    "analytix_stage_seconds", "Time spent in agent stages, LLM calls, retrieval and analyzer functions.",
+    ("component", "stage")
+)
+HTTP_SECONDS = registry.histogram(
+    "analytix_http_request_seconds", "HTTP request latency by route.", ("method", "route", "status")
+)
+
+# Spans recorded by timer() in the current context, if a trace() is open
+_spans = contextvars.ContextVar("metrics_spans", default=None)
+
+
+@contextmanager
+def trace():
+    """
+    Collects every timer() span in this context (thread) into the yielded
+    list, for a per-request or per-job timing breakdown.
+    """
+    spans = []
+    token = _spans.set(spans)
+    try:
+        yield spans
+    finally:
+        _spans.reset(token)
+
+
+def record(component: str, stage: str, seconds: float):
+    """
+    Adds one measurement to STAGE_SECONDS and to the open trace, if any.
+    """
+    STAGE_SECONDS.observe(seconds, component=component, stage=stage)
+    spans = _spans.get()
+    if spans is not None:
+        spans.append((f"{component}.{stage}", seconds))
+
+
+@contextmanager
+def timer(component: str, stage: str):
+    """
+    Times a block with record().
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(component, stage, time.perf_counter() - start)
+
+
+def timed(component: str, stage: str = None):
+    """
+    Decorator form of timer(); the stage defaults to the function name.
+    """
+    def decorator(fn):
+        name = stage or fn.__name__
+
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            with timer(component, name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def breakdown(spans):
+    """
+    Totals per stage in first-seen order: {"agent.decide": {"seconds", "calls"}}.
+    Nested stages (an LLM call inside agent.decide) are counted in both.
+    """
+    totals = {}
+    for name, seconds in spans:
+        item = totals.setdefault(name, {"seconds": 0.0, "calls": 0})
+        item["seconds"] += seconds
+        item["calls"] += 1
+    for item in totals.values():
+        item["seconds"] = round(item["seconds"], 4)
+    return totals
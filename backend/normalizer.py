@@ -11,97 +11,179 @@ NO LLM regeneration.
 CODE is the authority.
 """
 
-def normalize_output(text: str, section_type: str) -> str:
-    if not text or not text.strip():
-        return "Insufficient data after normalization."
-
-    # ---------------- CONFIG ---------------- #
-
-    MAX_BULLETS = 8
-    MAX_WORDS_PER_LINE = 50
-
-    # Common forbidden concepts (global noise)
-    FORBIDDEN_COMMON = [
-        "conclusion", "recommend", "schedule", "training",
-        "environment", "correlation", "percentage", "predict",
-        "maintenance", "prevent", "tools", "steps", "guideline",
-        "manual", "education", "bullet points", "sentence per bullet",
-        "must include", "e.g.", "format:", "title:", "role:"
-    ]
-
-    SECTION_CONFIG = {
-        "root_cause": {
-            "title": "Root Cause Summary",
-            "forbidden": FORBIDDEN_COMMON + [
-                "repair", "replace", "inspect", "how to"
-            ]
-        },
-        "impact": {
-            "title": "Impact Assessment",
-            "forbidden": FORBIDDEN_COMMON + [
-                "cause", "caused by", "repair",
-                "replace", "inspect", "due to"
-            ]
-        },
-        "repair": {
-            "title": "Repair Guide",
-            "forbidden": FORBIDDEN_COMMON + [
-                "cause", "caused by", "correlation",
-                "frequency", "%", "impact", "due to"
-            ]
-        }
+import re
+
+# ---------------- CONFIG ---------------- #
+
+MAX_BULLETS = 8
+MAX_WORDS_PER_LINE = 50
+INSUFFICIENT = "Insufficient data after normalization."
+
+# Common forbidden concepts (global noise)
+FORBIDDEN_COMMON = [
+    "conclusion", "recommend", "schedule", "training",
+    "environment", "correlation", "percentage", "predict",
+    "maintenance", "prevent", "tools", "steps", "guideline",
+    "manual", "education", "bullet points", "sentence per bullet",
+    "must include", "e.g.", "format:", "title:", "role:"
+]
+
+# Headings, sections and stray titles (matched at line start)
+HEADING_PREFIXES = [
+    "#", "section", "root cause", "impact assessment",
+    "repair guide", "analysis", "failure", "title"
+]
+
+SECTION_CONFIG = {
+    "root_cause": {
+        "title": "Root Cause Summary",
+        "forbidden": FORBIDDEN_COMMON + [
+            "repair", "replace", "inspect", "how to"
+        ]
+    },
+    "impact": {
+        "title": "Impact Assessment",
+        "forbidden": FORBIDDEN_COMMON + [
+            "cause", "caused by", "repair",
+            "replace", "inspect", "due to"
+        ]
+    },
+    "repair": {
+        "title": "Repair Guide",
+        "forbidden": FORBIDDEN_COMMON + [
+            "cause", "caused by", "correlation",
+            "frequency", "%", "impact", "due to"
+        ]
     }
+}
+
+
+def compile_phrases(phrases, anchored=False):
+    """
+    Compiles phrases into one regex shaped as a trie (shared prefixes are
+    matched once), so a line is scanned in a single pass however many
+    phrases there are. Matches substrings, like `phrase in line`; a phrase
+    that extends another adds nothing and is pruned.
+    """
+    trie = {}
+    for phrase in phrases:
+        node = trie
+        for ch in phrase:
+            node = node.setdefault(ch, {})
+        node[""] = True
+
+    def build(node):
+        if "" in node:
+            return ""
+        alternatives = [re.escape(ch) + build(child) for ch, child in sorted(node.items())]
+        if len(alternatives) == 1:
+            return alternatives[0]
+        return "(?:" + "|".join(alternatives) + ")"
+
+    return re.compile(("^" if anchored else "") + build(trie))
+
+
+HEADING_RE = compile_phrases(HEADING_PREFIXES, anchored=True)
+
+# Compiled once at import: section -> (title, forbidden matcher)
+SECTIONS = {
+    name: (config["title"], compile_phrases(config["forbidden"]))
+    for name, config in SECTION_CONFIG.items()
+}
+
+
+# ---------------- NORMALIZATION ---------------- #
+
+class StreamNormalizer:
+    """
+    Incremental normalizer for one section. feed() takes text chunks as
+    they arrive (tokens or lines) and returns the output lines completed so
+    far, the title first; finish() flushes the last partial line. Each line
+    is checked once, with one regex pass per rule, when its newline arrives.
+    """
+
+    def __init__(self, section_type: str):
+        self.section = SECTIONS.get(section_type)
+        self.bullets = []
+        self._partial = ""
+        self._finished = False
+
+    @property
+    def full(self):
+        return len(self.bullets) >= MAX_BULLETS
+
+    def _accept(self, line: str):
+        line = line.strip()
+        if not line or self.section is None:
+            return None
+        lower = line.lower()
 
-    if section_type not in SECTION_CONFIG:
-        return "Insufficient data after normalization."
-
-    title = SECTION_CONFIG[section_type]["title"]
-    forbidden = SECTION_CONFIG[section_type]["forbidden"]
-
-    # ---------------- NORMALIZATION ---------------- #
+        # Remove headings, sections, numbering, markdown
+        if HEADING_RE.match(lower):
+            return None
 
-    cleaned_bullets = []
-    lines = [l.strip() for l in text.splitlines() if l.strip()]
+        # Remove long explanations / paragraphs
+        if len(line.split(None, MAX_WORDS_PER_LINE)) > MAX_WORDS_PER_LINE:
+            return None
 
-    for line in lines:
-        lower = line.lower()
+        # Remove forbidden semantic leakage
+        if self.section[1].search(lower):
+            return None
 
-        # ❌ Remove headings, sections, numbering, markdown
-        if (
-            lower.startswith("#")
-            or lower.startswith("section")
-            or lower.startswith("root cause")
-            or lower.startswith("impact assessment")
-            or lower.startswith("repair guide")
-            or lower.startswith("analysis")
-            or lower.startswith("failure")
-            or lower.startswith("title")
-        ):
-            continue
-
-        # ❌ Remove long explanations / paragraphs
-        if len(line.split()) > MAX_WORDS_PER_LINE:
-            continue
-
-        # ❌ Remove forbidden semantic leakage
-        if any(word in lower for word in forbidden):
-            continue
-
-        # ✅ Accept only declarative content
+        # Accept only declarative content
         bullet = line.rstrip(".")
         if not bullet.startswith("-"):
             bullet = "- " + bullet
-
-        cleaned_bullets.append(bullet)
-
-        if len(cleaned_bullets) >= MAX_BULLETS:
+        self.bullets.append(bullet)
+        return bullet
+
+    def _emit(self, lines):
+        out = []
+        for line in lines:
+            if self.full:
+                break
+            bullet = self._accept(line)
+            if bullet is not None:
+                if len(self.bullets) == 1:
+                    out.append(self.section[0])
+                out.append(bullet)
+        return out
+
+    def feed(self, chunk: str):
+        if self._finished or self.full or not chunk:
+            return []
+        lines = (self._partial + chunk).splitlines(keepends=True)
+        # Hold back the last line until its line break arrives
+        last = lines[-1]
+        self._partial = lines.pop() if last.splitlines()[0] == last else ""
+        return self._emit(lines)
+
+    def finish(self):
+        if self._finished:
+            return []
+        self._finished = True
+        out = self._emit(self._partial.splitlines())
+        self._partial = ""
+        if not self.bullets:
+            out.append(INSUFFICIENT)
+        return out
+
+
+def normalize_stream(chunks, section_type: str):
+    """
+    Generator form: yields normalized output lines while `chunks` streams.
+    """
+    normalizer = StreamNormalizer(section_type)
+    for chunk in chunks:
+        yield from normalizer.feed(chunk)
+        if normalizer.full:
             break
+    yield from normalizer.finish()
 
-    # ---------------- FALLBACK ---------------- #
-
-    if not cleaned_bullets:
-        return "Insufficient data after normalization."
 
-    # ---------------- FINAL OUTPUT ---------------- #
+def normalize_output(text: str, section_type: str) -> str:
+    if not text or not text.strip():
+        return INSUFFICIENT
 
-    return title + "\n" + "\n".join(cleaned_bullets)
+    normalizer = StreamNormalizer(section_type)
+    return "\n".join(normalizer.feed(text) + normalizer.finish())
@@ -0,0 +1,71 @@
+"""
+Startup import profile for the backend.
+
+Runs `python -X importtime -c "import main"` in a fresh interpreter and reports
+the cold import time plus the slowest top-level modules, then the time for the
+deferred warm-up (knowledge base + plotting), i.e. what import used to cost
+before those were made lazy.
+
+    python profile_startup.py [--top 15] [--no-warm-up]
+"""
+import os
+import sys
+import time
+import argparse
+import subprocess
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def _run(code: str):
+    env = dict(os.environ, WARM_UP="0", PYTHONWARNINGS="ignore")
+    start = time.time()
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        cwd=BACKEND_DIR, env=env, capture_output=True, text=True
+    )
+    wall = time.time() - start
+    if proc.returncode != 0:
+        raise RuntimeError(proc.stderr.strip().splitlines()[-1] if proc.stderr.strip() else "import failed")
+    return wall, proc.stderr, proc.stdout
+
+
+def parse_importtime(stderr: str):
+    """
+    Returns [(cumulative_seconds, module, depth)], slowest first. Depth 0 is
+    a top-level import (e.g. main), depth 1 is imported directly by one.
+    """
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative_us, name = line.split("|")
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        rows.append((int(cumulative_us) / 1e6, name.strip(), depth))
+    return sorted(rows, reverse=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Profile backend startup imports.")
+    parser.add_argument("--top", type=int, default=15)
+    parser.add_argument("--no-warm-up", action="store_true", help="skip timing the deferred warm-up")
+    args = parser.parse_args()
+
+    wall, stderr, _ = _run("import main")
+    rows = parse_importtime(stderr)
+    total = next((r[0] for r in rows if r[1] == "main" and r[2] == 0), 0.0)
+    print(f"Cold `import main`: {wall:.2f}s wall, {total:.2f}s importing main")
+    print("\nSlowest direct imports:")
+    for seconds, name, _ in [r for r in rows if r[2] == 1][:args.top]:
+        print(f"  {seconds:7.3f}s  {name}")
+
+    if not args.no_warm_up:
+        code = "import time, main; t = time.time(); main.warm_up(); print(time.time() - t)"
+        warm_wall, _, stdout = _run(code)
+        warm = float(stdout.strip().splitlines()[-1])
+        print(f"\nDeferred warm-up (knowledge base + plotting): {warm:.2f}s")
+        print(f"Import + warm-up (previous eager startup): {warm_wall:.2f}s wall")
+
+
+if __name__ == "__main__":
+    main()
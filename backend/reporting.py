@@ -3,6 +3,7 @@ import json
 import uuid
 from datetime import datetime
 import pandas as pd
+from analyzer import find_target_column
 
 REPORTS_DIR = "reports"
 
@@ -14,8 +15,7 @@ def get_failures(df: pd.DataFrame):
     """
     Extracts rows where failure occurred.
     """
-    possible_cols = ["Machine failure", "Failure", "Target", "failure", "target"]
-    found_col = next((c for c in possible_cols if c in df.columns), None)
+    found_col = find_target_column(df)
     
     if found_col:
         # Filter where value is 1 (True)
@@ -84,6 +84,23 @@ def list_reports():
     reports.sort(key=lambda x: x["timestamp"], reverse=True)
     return reports
 
+def reports_version():
+    """
+    Changes whenever a report is added, removed or rewritten.
+    Only stats the directory entries; no report is read.
+    """
+    if not os.path.exists(REPORTS_DIR):
+        return "0"
+    entries = [e for e in os.scandir(REPORTS_DIR) if e.name.endswith(".json")]
+    latest = max((e.stat().st_mtime_ns for e in entries), default=0)
+    return f"{len(entries)}-{latest}"
+
+def report_version(report_id: str):
+    filename = f"{REPORTS_DIR}/{report_id}.json"
+    if os.path.exists(filename):
+        return f"{report_id}-{os.stat(filename).st_mtime_ns}"
+    return None
+
 def get_report(report_id: str):
     """
     Retrieves full report details.
@@ -0,0 +1,152 @@
+import os
+import math
+import time
+import threading
+from collections import OrderedDict, deque
+
+from state import state
+from metrics import record
+
+# --- LLM CONCURRENCY ---
+# Match this to how many generations the LLM backend serves in parallel
+# (e.g. OLLAMA_NUM_PARALLEL).
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "2"))
+LLM_MAX_QUEUE = int(os.getenv("LLM_MAX_QUEUE", "16"))
+LLM_MAX_PENDING_PER_SESSION = int(os.getenv("LLM_MAX_PENDING_PER_SESSION", "2"))
+# Slots are also leased from the shared state, so the limit holds across
+# worker processes; a lease outlives a crashed holder by at most this long.
+LLM_LEASE_TTL = int(os.getenv("LLM_LEASE_TTL", "600"))
+LLM_LEASE_POLL = 0.2
+
+
+class SchedulerBusy(Exception):
+    """
+    Raised when a request is refused for backpressure.
+    Carries the queue position it would have had and an ETA in seconds.
+    """
+
+    def __init__(self, position: int, eta: float, reason: str):
+        self.position = position
+        self.eta = eta
+        self.reason = reason
+        super().__init__(f"{reason} (queue position {position}, ETA {eta:.0f}s)")
+
+
+class _Ticket:
+    __slots__ = ("granted",)
+
+    def __init__(self):
+        self.granted = False
+
+
+class LLMScheduler:
+    """
+    Bounded scheduler for LLM work.
+    At most `max_concurrency` jobs run at once; waiting jobs are served
+    round-robin across sessions so one busy user can't starve the others.
+    Interactive callers are refused with SchedulerBusy once the queue (or
+    their own session's share of it) is full. A granted job then takes one of
+    the `max_concurrency` host-wide leases, waiting while other worker
+    processes hold them all.
+    """
+
+    def __init__(self, max_concurrency=LLM_MAX_CONCURRENCY, max_queue=LLM_MAX_QUEUE,
+                 max_pending_per_session=LLM_MAX_PENDING_PER_SESSION):
+        self.max_concurrency = max(1, max_concurrency)
+        self.max_queue = max_queue
+        self.max_pending_per_session = max_pending_per_session
+        self._cond = threading.Condition()
+        self._active = 0
+        self._queues = OrderedDict()  # session_id -> deque of tickets, in rotation order
+        self._pending = {}  # session_id -> running + queued jobs
+        self._avg_service = 10.0  # seconds, moving average of job duration
+        self.lease_waits = 0
+
+    def _queued(self):
+        return sum(len(q) for q in self._queues.values())
+
+    def _eta(self, position):
+        return math.ceil(position / self.max_concurrency) * self._avg_service
+
+    def _grant_next(self):
+        while self._active < self.max_concurrency and self._queues:
+            session_id, q = next(iter(self._queues.items()))
+            ticket = q.popleft()
+            if q:
+                self._queues.move_to_end(session_id)
+            else:
+                del self._queues[session_id]
+            ticket.granted = True
+            self._active += 1
+
+    def _acquire(self, session_id, reject):
+        with self._cond:
+            if reject:
+                queued = self._queued()
+                if self._pending.get(session_id, 0) >= self.max_pending_per_session:
+                    raise SchedulerBusy(queued + 1, self._eta(queued + 1),
+                                        "Too many pending requests for this session")
+                if self._active >= self.max_concurrency and queued >= self.max_queue:
+                    raise SchedulerBusy(queued + 1, self._eta(queued + 1), "LLM queue is full")
+
+            self._pending[session_id] = self._pending.get(session_id, 0) + 1
+
+            if self._active < self.max_concurrency and not self._queues:
+                self._active += 1
+                return
+
+            ticket = _Ticket()
+            self._queues.setdefault(session_id, deque()).append(ticket)
+            while not ticket.granted:
+                self._cond.wait()
+
+    def _release(self, session_id, elapsed):
+        with self._cond:
+            self._active -= 1
+            self._pending[session_id] -= 1
+            if not self._pending[session_id]:
+                del self._pending[session_id]
+            self._avg_service = 0.8 * self._avg_service + 0.2 * elapsed
+            self._grant_next()
+            self._cond.notify_all()
+
+    def _lease(self):
+        token = state.acquire("llm_slots", self.max_concurrency, ttl=LLM_LEASE_TTL)
+        if token is None:
+            self.lease_waits += 1
+        while token is None:
+            time.sleep(LLM_LEASE_POLL)
+            token = state.acquire("llm_slots", self.max_concurrency, ttl=LLM_LEASE_TTL)
+        return token
+
+    def run(self, session_id, fn, *args, reject=True, **kwargs):
+        """
+        Runs fn(*args, **kwargs) once a slot is free.
+        With reject=False (background work) the caller always waits its turn.
+        """
+        queued_at = time.time()
+        self._acquire(session_id, reject)
+        start = time.time()
+        token = None
+        try:
+            token = self._lease()
+            record("llm", "queue_wait", time.time() - queued_at)
+            return fn(*args, **kwargs)
+        finally:
+            if token is not None:
+                state.release("llm_slots", token)
+            self._release(session_id, time.time() - start)
+
+    def stats(self):
+        with self._cond:
+            return {
+                "max_concurrency": self.max_concurrency,
+                "active": self._active,
+                "queued": self._queued(),
+                "avg_service_seconds": round(self._avg_service, 2),
+                "lease_waits": self.lease_waits,
+            }
+
+
+# Singleton instance
+llm_scheduler = LLMScheduler()
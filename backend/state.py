@@ -0,0 +1,226 @@
+import os
+import json
+import time
+import uuid
+import sqlite3
+import threading
+
+# --- SHARED STATE ---
+# "sqlite" (default: shared by every worker process on this host, however
+# they were started, e.g. `uvicorn main:app --workers N`) or "memory"
+# (a single process only; each worker would get its own private state)
+WEB_WORKERS = int(os.getenv("WEB_WORKERS", "1"))
+STATE_BACKEND = os.getenv("STATE_BACKEND", "sqlite")
+STATE_DB = os.getenv("STATE_DB", os.path.join(os.path.dirname(__file__), "state.sqlite3"))
+
+
+class StateBackend:
+    """
+    Key/value store for state that every worker process must agree on:
+    the current dataset reference, analysis results, job snapshots and
+    concurrency leases. Values are JSON-serializable; keys may expire.
+    """
+
+    name = "base"
+
+    def get(self, key: str, default=None):
+        raise NotImplementedError
+
+    def set(self, key: str, value, ttl: float = None):
+        raise NotImplementedError
+
+    def delete(self, key: str):
+        raise NotImplementedError
+
+    def update(self, key: str, values: dict, ttl: float = None):
+        """
+        Atomically merges `values` into the dict stored at `key`.
+        """
+        raise NotImplementedError
+
+    def acquire(self, key: str, limit: int = 1, ttl: float = 60):
+        """
+        Takes one of `limit` leases on `key`. Returns a token to pass to
+        release(), or None when all leases are held. Leases expire after
+        `ttl` seconds, so a crashed holder can't block others forever.
+        """
+        raise NotImplementedError
+
+    def release(self, key: str, token: str):
+        raise NotImplementedError
+
+    def nbytes(self):
+        """
+        Bytes this backend holds in process memory (None if it lives elsewhere).
+        """
+        return None
+
+
+class MemoryState(StateBackend):
+    """
+    In-process backend. Only correct when one process serves the API.
+    """
+
+    name = "memory"
+
+    def __init__(self):
+        self._data = {}  # key -> (value, expires_at)
+        self._leases = {}  # key -> {token: expires_at}
+        self._lock = threading.Lock()
+
+    def _live(self, key):
+        item = self._data.get(key)
+        if item is not None and item[1] is not None and item[1] < time.time():
+            del self._data[key]
+            return None
+        return item
+
+    def get(self, key, default=None):
+        with self._lock:
+            item = self._live(key)
+        # Round-trip so callers never share mutable state with the store
+        return json.loads(item[0]) if item is not None else default
+
+    def set(self, key, value, ttl=None):
+        with self._lock:
+            self._data[key] = (json.dumps(value), time.time() + ttl if ttl else None)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def update(self, key, values, ttl=None):
+        with self._lock:
+            item = self._live(key)
+            current = json.loads(item[0]) if item is not None else {}
+            current.update(values)
+            self._data[key] = (json.dumps(current), time.time() + ttl if ttl else None)
+
+    def acquire(self, key, limit=1, ttl=60):
+        now = time.time()
+        with self._lock:
+            leases = {t: exp for t, exp in self._leases.get(key, {}).items() if exp > now}
+            if len(leases) >= limit:
+                self._leases[key] = leases
+                return None
+            token = uuid.uuid4().hex
+            leases[token] = now + ttl
+            self._leases[key] = leases
+            return token
+
+    def release(self, key, token):
+        with self._lock:
+            self._leases.get(key, {}).pop(token, None)
+
+    def nbytes(self):
+        with self._lock:
+            return sum(len(key) + len(value) for key, (value, _) in self._data.items())
+
+
+class SQLiteState(StateBackend):
+    """
+    Backend shared by every process on the host through one SQLite file
+    (WAL mode). Read-modify-write operations run in IMMEDIATE transactions,
+    so they are atomic across processes.
+    """
+
+    name = "sqlite"
+
+    def __init__(self, path=STATE_DB):
+        self.path = path
+        self._local = threading.local()
+        self._writes = 0
+        with self._write() as conn:
+            conn.execute("CREATE TABLE IF NOT EXISTS kv (key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL)")
+            conn.execute("CREATE TABLE IF NOT EXISTS leases (key TEXT NOT NULL, token TEXT PRIMARY KEY, expires_at REAL NOT NULL)")
+
+    def _conn(self):
+        # One connection per thread; sqlite3 connections aren't shareable across threads
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _write(self):
+        return _Transaction(self._conn())
+
+    def get(self, key, default=None):
+        # Autocommit read; WAL readers don't block writers
+        row = self._conn().execute("SELECT value, expires_at FROM kv WHERE key = ?", (key,)).fetchone()
+        if row is None or (row[1] is not None and row[1] < time.time()):
+            return default
+        return json.loads(row[0])
+
+    def set(self, key, value, ttl=None):
+        self._writes += 1
+        with self._write() as conn:
+            conn.execute("INSERT OR REPLACE INTO kv (key, value, expires_at) VALUES (?, ?, ?)",
+                         (key, json.dumps(value), time.time() + ttl if ttl else None))
+            if self._writes % 100 == 0:
+                conn.execute("DELETE FROM kv WHERE expires_at < ?", (time.time(),))
+
+    def delete(self, key):
+        with self._write() as conn:
+            conn.execute("DELETE FROM kv WHERE key = ?", (key,))
+
+    def update(self, key, values, ttl=None):
+        with self._write() as conn:
+            row = conn.execute("SELECT value, expires_at FROM kv WHERE key = ?", (key,)).fetchone()
+            current = {}
+            if row is not None and (row[1] is None or row[1] >= time.time()):
+                current = json.loads(row[0])
+            current.update(values)
+            conn.execute("INSERT OR REPLACE INTO kv (key, value, expires_at) VALUES (?, ?, ?)",
+                         (key, json.dumps(current), time.time() + ttl if ttl else None))
+
+    def acquire(self, key, limit=1, ttl=60):
+        now = time.time()
+        with self._write() as conn:
+            conn.execute("DELETE FROM leases WHERE key = ? AND expires_at < ?", (key, now))
+            held = conn.execute("SELECT COUNT(*) FROM leases WHERE key = ?", (key,)).fetchone()[0]
+            if held >= limit:
+                return None
+            token = uuid.uuid4().hex
+            conn.execute("INSERT INTO leases (key, token, expires_at) VALUES (?, ?, ?)", (key, token, now + ttl))
+            return token
+
+    def release(self, key, token):
+        with self._write() as conn:
+            conn.execute("DELETE FROM leases WHERE key = ? AND token = ?", (key, token))
+
+
+class _Transaction:
+    """
+    BEGIN IMMEDIATE ... COMMIT around a block (ROLLBACK on error).
+    """
+
+    def __init__(self, conn):
+        self.conn = conn
+
+    def __enter__(self):
+        self.conn.execute("BEGIN IMMEDIATE")
+        return self.conn
+
+    def __exit__(self, exc_type, exc, tb):
+        self.conn.execute("ROLLBACK" if exc_type else "COMMIT")
+        return False
+
+
+BACKENDS = {
+    "memory": MemoryState,
+    "sqlite": SQLiteState,
+}
+
+
+def get_state_backend(name: str = None) -> StateBackend:
+    name = name or STATE_BACKEND
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown state backend '{name}'. Choose from: {', '.join(BACKENDS)}")
+    return BACKENDS[name]()
+
+
+# Singleton instance
+state = get_state_backend()
@@ -1,13 +1,19 @@
-def search_web(query: str):
+def search_web(query: str, timeout: float = 10, raise_errors: bool = False):
     """
     Searches the web for the given query using DuckDuckGo.
-    Returns the search summary. Returns None if search fails.
+    Returns the search summary, or None if nothing was found. Failures
+    (offline, rate limited) also return None unless raise_errors is set.
+    `timeout` bounds each HTTP request, so a hung search can't hold its thread.
     """
     try:
-        from langchain_community.tools import DuckDuckGoSearchRun
-        search = DuckDuckGoSearchRun()
-        return search.run(query)
+        from duckduckgo_search import DDGS
+        with DDGS(timeout=timeout) as ddgs:
+            # Same settings the LangChain DuckDuckGo wrapper used
+            results = ddgs.text(query, region="wt-wt", safesearch="moderate", timelimit="y", max_results=5)
+        return " ".join(r["body"] for r in results if r.get("body")) or None
     except Exception as e:
+        if raise_errors:
+            raise
         # Return None so the caller knows it failed, rather than an error string
         # that might be confused for a definition.
         print(f"Web Search Warning: {str(e)}")
@@ -0,0 +1,45 @@
+import sys
+import threading
+import multiprocessing as mp
+from contextlib import contextmanager
+
+_ctx = None
+# Pools start workers from several threads; __main__.__file__ is process-global
+_main_path_lock = threading.RLock()
+
+
+def process_context():
+    """
+    Multiprocessing context shared by all worker pools.
+    On POSIX workers fork from a forkserver that already imported
+    pandas/numpy and the worker entry points; elsewhere they are spawned.
+    """
+    global _ctx
+    if _ctx is None:
+        if "forkserver" in mp.get_all_start_methods():
+            _ctx = mp.get_context("forkserver")
+            _ctx.set_forkserver_preload(["executor", "analysis_pool"])
+        else:
+            _ctx = mp.get_context("spawn")
+    return _ctx
+
+
+@contextmanager
+def without_main_path():
+    """
+    When the server is started as a script (`python main.py`), multiprocessing
+    would re-run that script in every worker. Workers only need library
+    modules, so hide the script path while they start. Serialized, so one
+    thread can't restore the path while another is still starting a worker.
+    """
+    with _main_path_lock:
+        main = sys.modules.get("__main__")
+        path = getattr(main, "__file__", None)
+        if main is None or path is None or getattr(main, "__spec__", None) is not None:
+            yield
+            return
+        del main.__file__
+        try:
+            yield
+        finally:
+            main.__file__ = path
@@ -1,6 +1,16 @@
 import { useState, useRef, useEffect } from "react";
 import axios from "axios";
 
+// One agent session per browser tab
+const getSessionId = () => {
+  let id = sessionStorage.getItem("chatSessionId");
+  if (!id) {
+    id = Math.random().toString(36).slice(2) + Date.now().toString(36);
+    sessionStorage.setItem("chatSessionId", id);
+  }
+  return id;
+};
+
 function Chat() {
   const [q, setQ] = useState("");
   const [messages, setMessages] = useState([]);
@@ -22,11 +32,19 @@ function Chat() {
     setLoading(true);
 
     try {
-      const res = await axios.post("http://localhost:8000/chat", { question: userMsg.content });
+      const res = await axios.post(
+        "http://localhost:8000/chat",
+        { question: userMsg.content },
+        { headers: { "X-Session-ID": getSessionId() } }
+      );
       const aiMsg = { role: "ai", content: res.data.answer || "I couldn't process that." };
       setMessages(prev => [...prev, aiMsg]);
     } catch (e) {
-      setMessages(prev => [...prev, { role: "ai", content: "Error connecting to Agent." }]);
+      const detail = e.response && e.response.status === 429 ? e.response.data.detail : null;
+      const content = detail
+        ? `Agent is busy (queue position ${detail.queue_position}, ~${Math.ceil(detail.eta_seconds)}s). Please try again shortly.`
+        : "Error connecting to Agent.";
+      setMessages(prev => [...prev, { role: "ai", content }]);
     } finally {
       setLoading(false);
     }
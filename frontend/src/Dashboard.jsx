@@ -95,19 +95,16 @@ export default function Dashboard() {
   const fetchEDA = async () => {
     setReportLoading(false); // No auto-loading
     try {
-      const [edaRes, plotsRes] = await Promise.all([
-        axios.get("http://localhost:8000/eda"),
-        axios.get("http://localhost:8000/eda_plots")
-      ]);
+      // One snapshot request instead of separate /eda and /eda_plots calls
+      const res = await axios.get("http://localhost:8000/dashboard/snapshot?fields=eda,plots");
 
-      if (edaRes.data.error) setData(null);
+      if (res.data.error) setData(null);
       else {
-        setData(edaRes.data);
+        setData(res.data.eda);
         // We do NOT check checkAcronyms() here anymore, because upload handler does it.
         // checkAcronyms(); 
+        if (res.data.plots && !res.data.plots.error) setPlots(res.data.plots);
       }
-
-      if (!plotsRes.data.error) setPlots(plotsRes.data);
     } catch (e) {
       console.error(e);
     }
@@ -124,9 +121,9 @@ export default function Dashboard() {
     try {
       if (type === 'what') {
         // ULTRA-FAST PATH: Use deterministic Python analysis
-        const res = await axios.get("http://localhost:8000/analysis/fast_failure");
-        if (res.data.answer) {
-          setReports(prev => ({ ...prev, 'Failure Identification': res.data.answer }));
+        const res = await axios.get("http://localhost:8000/dashboard/snapshot?fields=fast_failure");
+        if (res.data.fast_failure) {
+          setReports(prev => ({ ...prev, 'Failure Identification': res.data.fast_failure }));
         }
         loadFailures(); // Auto-open logs
       } else {
@@ -26,6 +26,33 @@ function Manuals() {
         }
     };
 
+    // Indexing runs as a background job; poll it for progress
+    const waitForIndexing = async (jobId) => {
+        while (true) {
+            const response = await fetch(`http://localhost:8000/jobs/${jobId}`);
+            if (!response.ok) {
+                // Expired or unknown job: stop polling instead of spinning forever
+                setMessage(`Error: Could not get indexing status (HTTP ${response.status}).`);
+                return;
+            }
+            const job = await response.json();
+            if (job.status === 'done') {
+                setMessage('Success: Manual indexed.');
+                return;
+            }
+            if (job.status === 'failed' || job.status === 'cancelled') {
+                setMessage('Error: Indexing ' + job.status + (job.error ? ': ' + job.error : ''));
+                return;
+            }
+            if (job.status !== 'queued' && job.status !== 'running') {
+                setMessage('Error: Unexpected indexing status: ' + (job.status || 'missing'));
+                return;
+            }
+            setMessage(`Indexing... ${Math.round(job.progress * 100)}% (${job.message || job.status})`);
+            await new Promise(resolve => setTimeout(resolve, 1000));
+        }
+    };
+
     const handleUpload = async () => {
         if (!file) return;
 
@@ -42,10 +69,12 @@ function Manuals() {
             });
             const data = await response.json();
 
-            if (response.ok) {
-                setMessage('Success: ' + data.message);
+            if (response.ok && data.job_id) {
                 setFile(null);
                 fetchManuals(); // Refresh list
+                await waitForIndexing(data.job_id);
+            } else if (response.ok) {
+                setMessage('Error: ' + data.error);
             } else {
                 setMessage('Error: ' + data.error);
             }